@@ -1,7 +1,14 @@
 import streamlit as st
+
+from viability.scoring import evaluate
+from viability.ui import page_profile, show_profile
+
 st.title('A Project by FCCP Team!')
 st.title('Project Viability Calculation from Weighted Ranks')
 
+# Optional stage timing for this rerun (sidebar toggle or VIABILITY_PROFILE)
+profile = page_profile('Main')
+
 # Input boxes for weights
 st.subheader('Enter the weights (percentiles):')
 
@@ -27,28 +34,19 @@ else:
     X4 = st.slider('Score X4', 0, 5, 3)  # Adjusted to a maximum score of 5
     X5 = st.slider('Score X5', 0, 1, 1)
 
-    # Calculate Y
-    Y = (weights['w1'] * X1 +
-         weights['w2'] * X2 +
-         weights['w3'] * X3 +
-         weights['w4'] * X4 +
-         weights['w5'] * X5)
+    # Calculate Y against the maximum achievable score (X4 adjusted to a maximum of 5)
+    result = evaluate([[X1, X2, X3, X4, X5]], list(weights.values()), column_max=[5, 5, 5, 5, 1])
+    Y = result.y[0]
 
     # Display the result
     st.subheader('Calculated Final Score:')
     st.write(Y)
-    
-    # Determine the viability threshold dynamically
-    max_Y = (weights['w1'] * 5 +
-             weights['w2'] * 5 +
-             weights['w3'] * 5 +
-             weights['w4'] * 5 +  # Adjusted to a maximum score of 5
-             weights['w5'] * 1)
-
-    threshold = max_Y * 0.75
-
-    # Determine if the project is viable
-    if Y > threshold:
+
+    # Determine if the project is viable (threshold is 75% of the maximum score)
+    if result.viable[0]:
         st.success("Viable Project")
     else:
         st.warning("Not a viable project")
+    profile.lap('score')
+
+show_profile(profile)
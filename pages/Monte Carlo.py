@@ -1,127 +1,180 @@
-import streamlit as st
-import pandas as pd
 import numpy as np
+import streamlit as st
+
+from viability.bootstrap import REPLICATES, bootstrap_groups, group_codes
+from viability.hierarchy import ALL, LEVELS, hierarchy_index
+from viability.montecarlo import (DEFAULT_SEED, MAX_DRAWS, NOISE_DISTRIBUTIONS, SAMPLERS, plant_viability,
+                                  simulate, simulate_until)
+from viability.scoring import column_range, criteria_matrix, score
+from viability.scoring import threshold as scoring_threshold
+from viability.ui import (criteria_columns, dataset_preview, dataset_stage, follow_job, group_rankings, job_key,
+                          page_graph, page_profile, show_cache_stats, show_graph, show_job, show_profile,
+                          show_session_jobs, simulation_results, submit_job, top_scores, uploaded_dataset,
+                          weight_sliders)
 
 st.title('Monte Carlo Simulation for Selected State')
 
-# Upload Excel file
-uploaded_file = st.file_uploader("Upload an Excel file", type=["xlsx"])
+# Optional stage timing for this rerun (sidebar toggle or VIABILITY_PROFILE)
+profile = page_profile('Monte Carlo')
 
-if uploaded_file is not None:
-    # Read the Excel file
-    df = pd.read_excel(uploaded_file)
+# Stages of this page, each recomputed only when something upstream of it changed
+graph = page_graph('Monte Carlo')
+running = None
 
-    # Display the uploaded file
+# Upload Excel file (parsed once per file and shared by all pages)
+df = uploaded_dataset()
+profile.lap('ingest', rows=None if df is None else len(df))
+
+if df is not None:
+    # Preview of the uploaded file, filled in once the criteria columns are known
     st.write("Uploaded Excel file:")
-    st.dataframe(df)
+    preview = st.container()
 
     # Ensure required columns are present
     required_columns = ['PSTATABB', 'Plant county name', 'PNAME', 'GEN', 'PIPE', 'MARKET', 'INCENTIVES', 'WATER']
     if not all(col in df.columns for col in required_columns):
         st.error(f"The uploaded file must contain the columns: {', '.join(required_columns)}.")
+        with preview:
+            dataset_preview(df, [])
     else:
-        # Dropdown for selecting state code
-        state_code_options = ["All"] + df['PSTATABB'].unique().tolist()
-        state_code = st.selectbox('Select State Code (PSTATABB)', state_code_options)
+        # Cascading dropdowns served from the precomputed state -> county -> plant index
+        index = hierarchy_index(df)
+        state_code = st.selectbox('Select State Code (PSTATABB)', [ALL] + index.states())
+        county = st.selectbox('Select County', [ALL] + index.counties(state_code))
+        plant = st.selectbox('Select Plant Name', [ALL] + index.plants(state_code, county))
+
+        # Rows matching the selection ('All' leaves a level unfiltered)
+        data = dataset_stage(graph, df)
+        selection = (state_code, county, plant)
+        rows = graph.node('filter', lambda frame: hierarchy_index(frame).select(*selection), data,
+                          params=selection, store=None)
+        df_state = rows.value
+        profile.lap('filter', rows=len(df_state))
 
-        if state_code != "All":
-            df_state = df[df['PSTATABB'] == state_code]
-        else:
-            df_state = df.copy()
+        # Select columns for the Monte Carlo simulation
+        st.subheader('Select columns for Monte Carlo simulation:')
+        criteria = criteria_columns(df)
 
-        # Dropdown for selecting county
-        county_options = ["All"] + df_state['Plant county name'].unique().tolist()
-        county = st.selectbox('Select County', county_options)
+        # Paginated preview of the identifier and selected criteria columns
+        with preview:
+            dataset_preview(df, criteria)
+        profile.lap('preview', rows=len(df))
 
-        if county != "All":
-            df_state = df_state[df_state['Plant county name'] == county]
+        # Criteria of the selected rows
+        matrix = graph.node('column mapping', lambda view: criteria_matrix(view, criteria), rows, params=(criteria,))
 
-        # Dropdown for selecting plant name
-        plant_options = ["All"] + df_state['PNAME'].unique().tolist()
-        plant = st.selectbox('Select Plant Name', plant_options)
+        # Input sliders for weights
+        weights = weight_sliders(len(criteria))
 
-        if plant != "All":
-            df_state = df_state[df_state['PNAME'] == plant]
+        # Resample whole plants (keeping their criteria together) or each criterion on its own
+        joint = st.radio('Resample', ['Whole plants', 'Each criterion independently'], horizontal=True,
+                         help='Whole plants keeps the correlations between the criteria of a plant.') == 'Whole plants'
 
-        # Select columns for the Monte Carlo simulation
-        st.subheader('Select columns for Monte Carlo simulation:')
-        X1_col = st.selectbox('Select column for X1', df.columns, index=df.columns.get_loc('GEN'))
-        X2_col = st.selectbox('Select column for X2', df.columns, index=df.columns.get_loc('PIPE'))
-        X3_col = st.selectbox('Select column for X3', df.columns, index=df.columns.get_loc('MARKET'))
-        X4_col = st.selectbox('Select column for X4', df.columns, index=df.columns.get_loc('INCENTIVES'))
-        X5_col = st.selectbox('Select column for X5', df.columns, index=df.columns.get_loc('WATER'))
+        # Fixed number of simulations, or draw until the estimates reach a tolerance
+        mode = st.radio('Simulation mode', ['Fixed number of simulations', 'Until converged'], horizontal=True)
+        if mode == 'Fixed number of simulations':
+            num_simulations = st.number_input('Number of simulations', min_value=100, max_value=100_000_000,
+                                              value=1_000_000)
+        else:
+            sampler = st.selectbox('Sampling', SAMPLERS,
+                                   format_func={'sobol': 'Scrambled Sobol', 'lhs': 'Latin hypercube',
+                                                'random': 'Pseudo-random'}.get)
+            tolerance = st.number_input('Tolerance on mean Y (95% CI half-width, 0 to ignore)', min_value=0.0,
+                                        value=0.001, step=0.001, format='%.4f')
+            p_tolerance = st.number_input('Tolerance on P(viable) (95% CI half-width, 0 to ignore)', min_value=0.0,
+                                          value=0.001, step=0.001, format='%.4f')
+            max_draws = st.number_input('Maximum number of simulations', min_value=10_000,
+                                        max_value=1_000_000_000, value=MAX_DRAWS)
+        # The same seed reproduces the same result
+        seed = st.number_input('Random seed', min_value=0, value=DEFAULT_SEED, step=1)
+
+        # Simulations run as background jobs keyed by their inputs, so they keep going
+        # while other inputs change and a rerun (or another page) picks them back up;
+        # the column mapping stage's key stands for the dataset, selection and criteria
+        if mode == 'Fixed number of simulations':
+            key = job_key('simulation', matrix.key, weights, int(num_simulations), int(seed), joint)
+        else:
+            key = job_key('simulation until converged', matrix.key, weights, sampler, tolerance,
+                          p_tolerance, int(max_draws), int(seed), joint)
+        label = f"{' / '.join(selection)}, seed {int(seed)}"
 
-        # Input sliders for weights
-        w1 = st.slider("Weight w1", 0, 100, 20) / 100.0
-        w2 = st.slider("Weight w2", 0, 100, 20) / 100.0
-        w3 = st.slider("Weight w3", 0, 100, 20) / 100.0
-        w4 = st.slider("Weight w4", 0, 100, 20) / 100.0
-        w5 = st.slider("Weight w5", 0, 100, 20) / 100.0
-
-        # Number of simulations
-        num_simulations = st.number_input('Number of simulations', min_value=100, max_value=10000, value=1000)
-
-        # Perform Monte Carlo simulation
-        if st.button('Run Simulation'):
-            X1_samples = np.random.choice(df_state[X1_col], num_simulations)
-            X2_samples = np.random.choice(df_state[X2_col], num_simulations)
-            X3_samples = np.random.choice(df_state[X3_col], num_simulations)
-            X4_samples = np.random.choice(df_state[X4_col], num_simulations)
-            X5_samples = np.random.choice(df_state[X5_col], num_simulations)
-
-            # Calculate Y for each simulation
-            Y_simulations = (w1 * X1_samples +
-                             w2 * X2_samples +
-                             w3 * X3_samples +
-                             w4 * X4_samples +
-                             w5 * X5_samples)
-
-            # Average Y value from simulations
-            Y_mean = np.mean(Y_simulations)
-
-            # Display results
-            st.subheader('Simulation Results')
-            st.write(f'Average Y value from {num_simulations} simulations: {Y_mean}')
+        if mode == 'Until converged' and not (tolerance or p_tolerance):
+            st.error('Set a tolerance on mean Y, P(viable) or both.')
+        elif st.button('Run Simulation'):
+            X_state = matrix.value
 
             # Determine the viability threshold dynamically
-            max_Y = (w1 * df_state[X1_col].max() +
-                     w2 * df_state[X2_col].max() +
-                     w3 * df_state[X3_col].max() +
-                     w4 * df_state[X4_col].max() +
-                     w5 * df_state[X5_col].max())
+            threshold = scoring_threshold(np.nanmax(X_state, axis=0), weights)
 
-            threshold = max_Y * 0.75
-
-            # Determine if the project is viable
-            if Y_mean > threshold:
-                st.success("Viable Project")
+            if mode == 'Fixed number of simulations':
+                # Draw the simulations in chunks so memory stays constant
+                submit_job(key, simulate, X_state, weights, int(num_simulations), threshold, seed=int(seed),
+                           joint=joint, label=f'{int(num_simulations):,} draws, {label}')
             else:
-                st.warning("Not a viable project")
+                submit_job(key, simulate_until, X_state, weights, threshold, tolerance or None,
+                           p_tolerance or None, sampler, max_draws=int(max_draws), seed=int(seed), joint=joint,
+                           label=f'Until converged, {label}')
+
+        # Progress (with a cancel button) while the job runs, the results once it is done
+        running = show_job(key, simulation_results)
+        profile.lap('monte carlo')
 
         # Box for user to input the size of the list
         list_size = st.number_input('Enter the size of the list', min_value=1, max_value=100, value=10, step=1)
 
-        # Calculate Y for all plants in the filtered dataframe
-        df_state['Y'] = (w1 * df_state[X1_col] +
-                         w2 * df_state[X2_col] +
-                         w3 * df_state[X3_col] +
-                         w4 * df_state[X4_col] +
-                         w5 * df_state[X5_col])
-
-        # Recompute threshold for overall viability
-        overall_max_Y = (w1 * df[X1_col].max() +
-                         w2 * df[X2_col].max() +
-                         w3 * df[X3_col].max() +
-                         w4 * df[X4_col].max() +
-                         w5 * df[X5_col].max())
-
-        threshold = overall_max_Y * 0.75
-
-        df_state['Viability'] = df_state['Y'].apply(lambda y: 'Viable' if y > threshold else 'Not Viable')
-
-        # Sort dataframe by Y in descending order and get the top entries
-        top_df = df_state.nlargest(list_size, 'Y')
+        # Optional per-plant robustness: perturb each plant's scores and estimate P(viable)
+        per_plant = st.checkbox('Estimate P(viable) for every plant under score noise')
+        if per_plant:
+            noise = st.selectbox('Noise distribution', NOISE_DISTRIBUTIONS)
+            noise_scale = st.number_input('Noise scale (score units)', min_value=0.0, value=0.5, step=0.1)
+            plant_draws = st.number_input('Draws per plant', min_value=100, max_value=100_000, value=1000, step=100)
+
+        # Viability threshold from the overall dataset
+        ranges = graph.node('column range', lambda frame: column_range(criteria_matrix(frame, criteria)), data,
+                            params=(criteria,))
+        limit = graph.node('threshold', lambda extent: scoring_threshold(extent[1], weights), ranges,
+                           params=(weights,), store=None)
+        table_columns = ['PSTATABB', 'Plant county name', 'PNAME', 'Y', 'Viability']
+
+        if per_plant:
+            p_viable = graph.node('per-plant viability',
+                                  lambda X, extent, threshold: plant_viability(
+                                      X, weights, threshold, draws=int(plant_draws), distribution=noise,
+                                      scale=noise_scale, low=extent[0], high=extent[1], seed=int(seed)),
+                                  matrix, ranges, limit,
+                                  params=(weights, int(plant_draws), noise, noise_scale, int(seed))).value
+            df_state = df_state.assign(**{'P(viable)': p_viable})
+            table_columns.append('P(viable)')
+            profile.lap('per-plant viability', rows=len(df_state))
+
+        # Top entries by Y (and their viability) from the presorted top-k index
+        top_df = top_scores(graph, df_state, matrix, weights, list_size, limit)
 
         # Display the top entries
         st.subheader('Top Y Scores:')
-        st.dataframe(top_df[['PSTATABB', 'Plant county name', 'PNAME', 'Y', 'Viability']])
+        st.dataframe(top_df[table_columns])
+        profile.lap('top-k', rows=len(df_state))
+
+        # Bootstrap confidence intervals on the ranking of states or counties in the selection
+        if st.checkbox('Rank states or counties with bootstrap confidence intervals'):
+            level = st.radio('Rank', ['States', 'Counties'], horizontal=True)
+            replicates = st.number_input('Bootstrap replicates', min_value=100, max_value=10_000,
+                                         value=REPLICATES, step=100)
+            levels, noun = (list(LEVELS[:1]), 'State') if level == 'States' else (list(LEVELS[:2]), 'County')
+
+            scores = graph.node('scoring', lambda X: score(X, weights), matrix, params=(weights,))
+            groups = graph.node('groups', lambda view: group_codes(view, levels), rows, params=(levels,))
+            ranking = graph.node('group bootstrap',
+                                 lambda y, grouped, threshold: bootstrap_groups(
+                                     y, y > threshold, *grouped, int(replicates), seed=int(seed)),
+                                 scores, groups, limit, params=(int(replicates), int(seed))).value
+            group_rankings(ranking, noun)
+            profile.lap('bootstrap rankings', rows=len(df_state) * int(replicates))
+
+show_cache_stats()
+show_session_jobs()
+show_graph(graph)
+show_profile(profile)
+
+# Keep a running simulation's progress bar moving until it finishes
+follow_job(running)
@@ -0,0 +1,130 @@
+import numpy as np
+import streamlit as st
+
+from viability.hierarchy import ALL, hierarchy_index
+from viability.scenarios import (Scenario, delete_scenarios, evaluate_scenarios, load_scenarios, put_scenario,
+                                 top_ranks, viable_matrix, weight_matrix)
+from viability.scoring import VIABILITY_FRACTION, column_range, criteria_matrix, labels
+from viability.ui import (criteria_columns, dataset_preview, dataset_stage, page_graph, page_profile,
+                          show_cache_stats, show_graph, show_profile, uploaded_dataset, weight_sliders)
+
+st.title('Scenario Comparison')
+
+# Optional stage timing for this rerun (sidebar toggle or VIABILITY_PROFILE)
+profile = page_profile('Scenarios')
+
+# Stages of this page, each recomputed only when something upstream of it changed
+graph = page_graph('Scenarios')
+
+# Upload Excel file (parsed once per file and shared by all pages)
+df = uploaded_dataset()
+profile.lap('ingest', rows=None if df is None else len(df))
+
+if df is not None:
+    # Preview of the uploaded file, filled in once the criteria columns are known
+    st.write("Uploaded Excel file:")
+    preview = st.container()
+
+    # Ensure required columns are present
+    required_columns = ['PSTATABB', 'Plant county name', 'PNAME']
+    if not all(col in df.columns for col in required_columns):
+        st.error(f"The uploaded file must contain the columns: {', '.join(required_columns)}.")
+        with preview:
+            dataset_preview(df, [])
+    else:
+        # Cascading dropdowns served from the precomputed state -> county -> plant index
+        index = hierarchy_index(df)
+        state_code = st.selectbox('Select State Code (PSTATABB)', [ALL] + index.states())
+        county_name = st.selectbox('Select Plant County Name', [ALL] + index.counties(state_code))
+        plant_name = st.selectbox('Select Plant Name (PNAME)', [ALL] + index.plants(state_code, county_name))
+
+        # Rows matching the selection ('All' leaves a level unfiltered)
+        data = dataset_stage(graph, df)
+        selection = (state_code, county_name, plant_name)
+        rows = graph.node('filter', lambda frame: hierarchy_index(frame).select(*selection), data,
+                          params=selection, store=None)
+        df_plant = rows.value
+        profile.lap('filter', rows=len(df_plant))
+
+        # Dropdowns to assign columns to X1 to XK
+        st.subheader('Assign columns to X1 to XK:')
+        criteria = criteria_columns(df)
+
+        # Paginated preview of the identifier and selected criteria columns
+        with preview:
+            dataset_preview(df, criteria)
+        profile.lap('preview', rows=len(df))
+
+        # Criteria of the selected rows and their dataset-wide maxima
+        matrix = graph.node('column mapping', lambda view: criteria_matrix(view, criteria), rows, params=(criteria,))
+        ranges = graph.node('column range', lambda frame: column_range(criteria_matrix(frame, criteria)), data,
+                            params=(criteria,))
+
+        # Save the current weights and viability fraction as a named scenario
+        st.subheader('Save a Scenario:')
+        weights = weight_sliders(len(criteria))
+        fraction = st.number_input('Viable above this share of the maximum Y (%)', min_value=0.0, max_value=100.0,
+                                   value=100 * VIABILITY_FRACTION, step=5.0) / 100
+        name = st.text_input('Scenario name')
+        if st.button('Save scenario', disabled=not name.strip()):
+            put_scenario(Scenario(name.strip(), dict(zip(criteria, weights)), fraction))
+
+        scenarios = load_scenarios()
+        if not scenarios:
+            st.info('Save at least one scenario to compare.')
+        else:
+            st.subheader('Saved Scenarios:')
+            removed = st.multiselect('Delete scenarios', [s.name for s in scenarios])
+            if removed and st.button('Delete selected'):
+                scenarios = delete_scenarios(removed)
+
+        if scenarios:
+            # Saved scenarios (criteria a scenario has no weight for count as zero)
+            W = weight_matrix(scenarios, criteria)
+            st.dataframe({'Scenario': [s.name for s in scenarios],
+                          'Viable above (%)': [100 * s.fraction for s in scenarios],
+                          **{c: W[j] for j, c in enumerate(criteria)}})
+
+            list_size = st.number_input('Enter the size of the list', min_value=1, max_value=100, value=10, step=1)
+            names = [s.name for s in scenarios]
+            fractions = [s.fraction for s in scenarios]
+
+            # All plants under all scenarios in one pass over the rows
+            results = graph.node('scenarios',
+                                 lambda X, extent: evaluate_scenarios(X, W, fractions, extent[1], list_size, names),
+                                 matrix, ranges, params=(W, fractions, list_size, names)).value
+            profile.lap('scenarios', rows=len(df_plant) * len(scenarios))
+
+            st.subheader('Viable Plants per Scenario:')
+            st.dataframe({'Scenario': names,
+                          'Threshold': results.thresholds,
+                          'Viable plants': results.viable,
+                          'Viable (%)': 100 * results.viable / max(len(df_plant), 1)})
+
+            # Rank of the baseline's top plants under every scenario (0 = outside that top list)
+            st.subheader('Rank Changes:')
+            baseline = names.index(st.selectbox('Baseline scenario', names))
+            tracked = results.top_rows[baseline]
+            ranks = top_ranks(results, tracked)
+            st.caption(f'Rank within each scenario\'s top {len(tracked)}; 0 means the plant drops out of it.')
+            st.dataframe(df_plant.iloc[tracked][['PSTATABB', 'Plant county name', 'PNAME']].assign(
+                **{n: ranks[:, i] for i, n in enumerate(names)}))
+
+            # Plants whose viability depends on the scenario
+            st.subheader('Viability Flips:')
+            flipping = results.flipping
+            st.write(f'{flipping.size:,} of {len(df_plant):,} plants are viable under some scenarios but not others.')
+            st.caption('Plants viable under the row scenario but not under the column scenario.')
+            st.dataframe({'Scenario': names, **{n: results.flips[:, i] for i, n in enumerate(names)}})
+            if flipping.size:
+                # The most contested plants first: viable in about half of the scenarios
+                contested = flipping[np.argsort(np.abs(2 * results.viable_in[flipping] - len(names)),
+                                                kind='stable')[:list_size]]
+                V = viable_matrix(matrix.value[contested], W, results.thresholds)
+                st.dataframe(df_plant.iloc[contested][['PSTATABB', 'Plant county name', 'PNAME']].assign(
+                    **{n: labels(V[:, i]) for i, n in enumerate(names)}))
+            profile.lap('comparison', rows=len(df_plant))
+
+show_cache_stats()
+show_graph(graph)
+show_profile(profile)
@@ -1,137 +1,165 @@
+import numpy as np
 import streamlit as st
-import pandas as pd
+
+from viability.hierarchy import ALL, hierarchy_index
+from viability.recourse import minimum_change
+from viability.robustness import (CONCENTRATION, MAX_GRID_POINTS, WEIGHT_SAMPLES, dirichlet_weights, grid_size,
+                                  rank_robustness, simplex_grid)
+from viability.scoring import column_range, criteria_matrix, evaluate
+from viability.scoring import threshold as scoring_threshold
+from viability.ui import (closest_to_viability, criteria_columns, dataset_preview, dataset_stage, page_graph,
+                          page_profile, show_cache_stats, show_graph, show_profile, top_scores, uploaded_dataset,
+                          weight_sliders)
 
 st.title('Y Calculation and Top Y Scores Listing')
 
-# Upload Excel file
-uploaded_file = st.file_uploader("Upload an Excel file", type=["xlsx"])
+# Optional stage timing for this rerun (sidebar toggle or VIABILITY_PROFILE)
+profile = page_profile('Scores')
+
+# Stages of this page, each recomputed only when something upstream of it changed
+graph = page_graph('Scores')
 
-if uploaded_file is not None:
-    # Read the Excel file
-    df = pd.read_excel(uploaded_file)
+# Upload Excel file (parsed once per file and shared by all pages)
+df = uploaded_dataset()
+profile.lap('ingest', rows=None if df is None else len(df))
 
-    # Display the uploaded file
+if df is not None:
+    # Preview of the uploaded file, filled in once the criteria columns are known
     st.write("Uploaded Excel file:")
-    st.dataframe(df)
+    preview = st.container()
 
     # Ensure required columns are present
     required_columns = ['PSTATABB', 'Plant county name', 'PNAME']
     if not all(col in df.columns for col in required_columns):
         st.error(f"The uploaded file must contain the columns: {', '.join(required_columns)}.")
+        with preview:
+            dataset_preview(df, [])
     else:
-        # Dropdown for selecting state code
-        state_code = st.selectbox('Select State Code (PSTATABB)', ['All'] + df['PSTATABB'].unique().tolist())
-
-        # Filter dataframe based on selected state code
-        if state_code != 'All':
-            df_state = df[df['PSTATABB'] == state_code]
-        else:
-            df_state = df
-
-        # Dropdown for selecting plant county name
-        county_name = st.selectbox('Select Plant County Name', ['All'] + df_state['Plant county name'].unique().tolist())
+        # Cascading dropdowns served from the precomputed state -> county -> plant index
+        index = hierarchy_index(df)
+        state_code = st.selectbox('Select State Code (PSTATABB)', [ALL] + index.states())
+        county_name = st.selectbox('Select Plant County Name', [ALL] + index.counties(state_code))
+        plant_name = st.selectbox('Select Plant Name (PNAME)', [ALL] + index.plants(state_code, county_name))
+
+        # Rows matching the selection ('All' leaves a level unfiltered)
+        data = dataset_stage(graph, df)
+        selection = (state_code, county_name, plant_name)
+        rows = graph.node('filter', lambda frame: hierarchy_index(frame).select(*selection), data,
+                          params=selection, store=None)
+        df_plant = rows.value
+        profile.lap('filter', rows=len(df_plant))
+
+        # Dropdowns to assign columns to X1 to XK
+        st.subheader('Assign columns to X1 to XK:')
+        criteria = criteria_columns(df)
+
+        # Paginated preview of the identifier and selected criteria columns
+        with preview:
+            dataset_preview(df, criteria)
+        profile.lap('preview', rows=len(df))
+
+        # Criteria of the selected rows, and minimum and maximum values for X1 to XK over the dataset
+        matrix = graph.node('column mapping', lambda view: criteria_matrix(view, criteria), rows, params=(criteria,))
+        ranges = graph.node('column range', lambda frame: column_range(criteria_matrix(frame, criteria)), data,
+                            params=(criteria,))
+        column_min, column_max = ranges.value
+        profile.lap('column mapping', rows=len(df))
 
-        # Filter dataframe based on selected county name
-        if county_name != 'All':
-            df_county = df_state[df_state['Plant county name'] == county_name]
-        else:
-            df_county = df_state
-
-        # Dropdown for selecting plant name
-        plant_name = st.selectbox('Select Plant Name (PNAME)', ['All'] + df_county['PNAME'].unique().tolist())
+        # Input sliders for weights
+        weights = weight_sliders(len(criteria))
+        limit = graph.node('threshold', lambda extent: scoring_threshold(extent[1], weights), ranges,
+                           params=(weights,), store=None)
 
-        # Filter dataframe based on selected plant name
-        if plant_name != 'All':
-            df_plant = df_county[df_county['PNAME'] == plant_name]
+        # Input sliders for X1 to XK with dynamic min and max values and default values
+        if plant_name != ALL:
+            plant_values = matrix.value[0]
         else:
-            df_plant = df_county
-
-        # Dropdowns to assign columns to X1 to X5
-        st.subheader('Assign columns to X1 to X5:')
-        available_columns = df.columns.tolist()
+            plant_values = column_min
 
-        X1_col = st.selectbox('Select column for X1', available_columns, index=available_columns.index('GEN') if 'GEN' in available_columns else 0)
-        X2_col = st.selectbox('Select column for X2', available_columns, index=available_columns.index('PIPE') if 'PIPE' in available_columns else 0)
-        X3_col = st.selectbox('Select column for X3', available_columns, index=available_columns.index('MARKET') if 'MARKET' in available_columns else 0)
-        X4_col = st.selectbox('Select column for X4', available_columns, index=available_columns.index('INCENTIVES') if 'INCENTIVES' in available_columns else 0)
-        X5_col = st.selectbox('Select column for X5', available_columns, index=available_columns.index('WATER') if 'WATER' in available_columns else 0)
+        # A blank cell starts its slider at the minimum
+        plant_values = np.where(np.isnan(plant_values), column_min, plant_values)
+        X = [st.slider(f'Score {col}', float(lo), float(hi), float(value))
+             for col, lo, hi, value in zip(criteria, column_min, column_max, plant_values)]
 
-        # Extract minimum and maximum values for X1 to X5
-        X1_min, X1_max = df[X1_col].min(), df[X1_col].max()
-        X2_min, X2_max = df[X2_col].min(), df[X2_col].max()
-        X3_min, X3_max = df[X3_col].min(), df[X3_col].max()
-        X4_min, X4_max = df[X4_col].min(), df[X4_col].max()
-        X5_min, X5_max = df[X5_col].min(), df[X5_col].max()
-
-        # Input sliders for weights
-        w1 = st.slider("Weight w1", 0, 100, 20) / 100.0
-        w2 = st.slider("Weight w2", 0, 100, 20) / 100.0
-        w3 = st.slider("Weight w3", 0, 100, 20) / 100.0
-        w4 = st.slider("Weight w4", 0, 100, 20) / 100.0
-        w5 = st.slider("Weight w5", 0, 100, 20) / 100.0
-
-        # Input sliders for X1 to X5 with dynamic min and max values and default values
-        if plant_name != 'All':
-            X1_value = df_plant[X1_col].values[0]
-            X2_value = df_plant[X2_col].values[0]
-            X3_value = df_plant[X3_col].values[0]
-            X4_value = df_plant[X4_col].values[0]
-            X5_value = df_plant[X5_col].values[0]
-        else:
-            X1_value = X1_min
-            X2_value = X2_min
-            X3_value = X3_min
-            X4_value = X4_min
-            X5_value = X5_min
-
-        X1 = st.slider(f'Score {X1_col}', float(X1_min), float(X1_max), float(X1_value))
-        X2 = st.slider(f'Score {X2_col}', float(X2_min), float(X2_max), float(X2_value))
-        X3 = st.slider(f'Score {X3_col}', float(X3_min), float(X3_max), float(X3_value))
-        X4 = st.slider(f'Score {X4_col}', float(X4_min), float(X4_max), float(X4_value))
-        X5 = st.slider(f'Score {X5_col}', float(X5_min), float(X5_max), float(X5_value))
-
-        # Calculate Y for a single plant
-        Y = (w1 * X1 +
-             w2 * X2 +
-             w3 * X3 +
-             w4 * X4 +
-             w5 * X5)
+        # Calculate Y for a single plant and the viability threshold (75% of the maximum Y)
+        result = graph.node('scoring', lambda extent: evaluate([X], weights, extent[1]), ranges,
+                            params=(X, weights), store=None).value
+        Y = result.y[0]
 
         # Display the calculated Y value
         st.subheader('Calculated Y Value:')
         st.write(Y)
-        
-        # Determine the viability threshold dynamically
-        max_Y = (w1 * X1_max +
-                 w2 * X2_max +
-                 w3 * X3_max +
-                 w4 * X4_max +
-                 w5 * X5_max)
-
-        threshold = max_Y * 0.75
 
         # Determine if the project is viable
-        if Y > threshold:
+        if result.viable[0]:
             st.success("Viable Project")
         else:
             st.warning("Not a viable project")
+        profile.lap('plant score')
 
         # Input box for the size of the list
         list_size = st.number_input('Enter the size of the list', min_value=1, max_value=100, value=10, step=1)
 
-        # Calculate Y for all plants in the filtered dataframe
-        df_plant['Y'] = (w1 * df_plant[X1_col] +
-                         w2 * df_plant[X2_col] +
-                         w3 * df_plant[X3_col] +
-                         w4 * df_plant[X4_col] +
-                         w5 * df_plant[X5_col])
-
-        # Determine viability for each project
-        df_plant['Viability'] = df_plant['Y'].apply(lambda y: 'Viable' if y > threshold else 'Not Viable')
-
-        # Sort dataframe by Y in descending order and get the top entries
-        top_df = df_plant.nlargest(list_size, 'Y')
+        table_columns = ['PSTATABB', 'Plant county name', 'PNAME', 'Y', 'Viability']
+
+        # Rank robustness: how often each plant stays in the top list as the weights move
+        if st.checkbox('Check how robust the top list is to the weights'):
+            method = st.radio('Weight samples', ['Around the chosen weights', 'Grid over all weights'])
+            if method == 'Around the chosen weights':
+                weight_samples = st.number_input('Number of weight samples', min_value=100, max_value=100_000,
+                                                 value=WEIGHT_SAMPLES, step=100)
+                concentration = st.number_input('Concentration (higher stays closer to the chosen weights)',
+                                                min_value=1.0, value=CONCENTRATION, step=10.0)
+                sampling = (int(weight_samples), concentration)
+            else:
+                grid_steps = st.number_input('Grid steps per weight', min_value=1, max_value=20, value=10, step=1)
+                sampling = (int(grid_steps),)
+
+            points = grid_size(len(criteria), *sampling) if method == 'Grid over all weights' else 0
+            if points > MAX_GRID_POINTS:
+                st.error(f'That grid has {points:,} weight vectors (the limit is {MAX_GRID_POINTS:,}). '
+                         'Use fewer steps or sample around the chosen weights.')
+            else:
+                def robustness(X):
+                    if method == 'Around the chosen weights':
+                        W = dirichlet_weights(weights, *sampling)
+                    else:
+                        W = simplex_grid(len(criteria), *sampling)
+                    return rank_robustness(X, W, list_size)
+
+                robust = graph.node('rank robustness', robustness, matrix,
+                                    params=(weights, list_size, method, sampling)).value
+                top_share = f'In top {list_size} (% of weight samples)'
+                df_plant = df_plant.assign(**{top_share: 100 * robust.top_k_frequency,
+                                              'Median rank': robust.rank_quantiles[:, 1]})
+                table_columns += [top_share, 'Median rank']
+                st.caption(f'{robust.samples} weight vectors evaluated.')
+                profile.lap('rank robustness', rows=len(df_plant))
+
+        # Smallest score or weight change that would make each non-viable plant viable
+        show_change = st.checkbox('Show the minimum change to viability')
+        if show_change:
+            change = graph.node('minimum change', lambda X, extent: minimum_change(X, weights, extent[1]),
+                                matrix, ranges, params=(weights,)).value
+            df_plant = df_plant.assign(**{'Gap to threshold': np.maximum(change.gap, 0),
+                                          'Score increase needed': change.score_total,
+                                          'Weight shift needed (%)': 100 * change.weight_shift})
+            table_columns += ['Gap to threshold', 'Score increase needed', 'Weight shift needed (%)']
+            profile.lap('minimum change', rows=len(df_plant))
+
+        # Top entries by Y (and their viability) from the presorted top-k index
+        top_df = top_scores(graph, df_plant, matrix, weights, list_size, limit)
 
         # Display the top entries
         st.subheader('Top Y Scores:')
-        st.dataframe(top_df[['PSTATABB', 'Plant county name', 'PNAME', 'Y', 'Viability']])
+        st.dataframe(top_df[table_columns])
+        profile.lap('top-k', rows=len(df_plant))
+
+        if show_change:
+            # Non-viable plants closest to the threshold, with the change each one needs
+            st.subheader('Closest to Viability:')
+            st.dataframe(closest_to_viability(df_plant, change, criteria, list_size))
+
+show_cache_stats()
+show_graph(graph)
+show_profile(profile)
@@ -1,148 +1,131 @@
-import streamlit as st
-import pandas as pd
 import numpy as np
+import streamlit as st
+
+from viability.hierarchy import ALL, hierarchy_index
+from viability.montecarlo import DEFAULT_SEED, simulate
+from viability.scoring import column_range, criteria_matrix
+from viability.scoring import threshold as scoring_threshold
+from viability.sensitivity import SOBOL_SAMPLES, one_at_a_time, sobol_indices, sweep_values
+from viability.ui import (criteria_columns, dataset_preview, dataset_stage, page_graph, page_profile,
+                          show_cache_stats, show_graph, show_profile, top_scores, uploaded_dataset, weight_sliders)
 
 st.title('Monte Carlo Simulation and Sensitivity Analysis for Selected State')
 
-# Upload Excel file
-uploaded_file = st.file_uploader("Upload an Excel file", type=["xlsx"])
+# Optional stage timing for this rerun (sidebar toggle or VIABILITY_PROFILE)
+profile = page_profile('Sensitivity Analysis')
 
-if uploaded_file is not None:
-    # Read the Excel file
-    df = pd.read_excel(uploaded_file)
+# Stages of this page, each recomputed only when something upstream of it changed
+graph = page_graph('Sensitivity Analysis')
 
-    # Display the uploaded file
+# Upload Excel file (parsed once per file and shared by all pages)
+df = uploaded_dataset()
+profile.lap('ingest', rows=None if df is None else len(df))
+
+if df is not None:
+    # Preview of the uploaded file, filled in once the criteria columns are known
     st.write("Uploaded Excel file:")
-    st.dataframe(df)
+    preview = st.container()
 
     # Ensure required columns are present
     required_columns = ['PSTATABB', 'Plant county name', 'PNAME', 'GEN', 'PIPE', 'MARKET', 'INCENTIVES', 'WATER']
     if not all(col in df.columns for col in required_columns):
         st.error(f"The uploaded file must contain the columns: {', '.join(required_columns)}.")
+        with preview:
+            dataset_preview(df, [])
     else:
-        # Dropdown for selecting state code
-        state_code_options = ["All"] + df['PSTATABB'].unique().tolist()
-        state_code = st.selectbox('Select State Code (PSTATABB)', state_code_options)
-
-        if state_code != "All":
-            df_state = df[df['PSTATABB'] == state_code].copy()
-        else:
-            df_state = df.copy()
-
-        # Dropdown for selecting county
-        county_options = ["All"] + df_state['Plant county name'].unique().tolist()
-        county = st.selectbox('Select County', county_options)
-
-        if county != "All":
-            df_state = df_state[df_state['Plant county name'] == county].copy()
-
-        # Dropdown for selecting plant name
-        plant_options = ["All"] + df_state['PNAME'].unique().tolist()
-        plant = st.selectbox('Select Plant Name', plant_options)
-
-        if plant != "All":
-            df_state = df_state[df_state['PNAME'] == plant].copy()
+        # Cascading dropdowns served from the precomputed state -> county -> plant index
+        index = hierarchy_index(df)
+        state_code = st.selectbox('Select State Code (PSTATABB)', [ALL] + index.states())
+        county = st.selectbox('Select County', [ALL] + index.counties(state_code))
+        plant = st.selectbox('Select Plant Name', [ALL] + index.plants(state_code, county))
+
+        # Rows matching the selection ('All' leaves a level unfiltered)
+        data = dataset_stage(graph, df)
+        selection = (state_code, county, plant)
+        rows = graph.node('filter', lambda frame: hierarchy_index(frame).select(*selection), data,
+                          params=selection, store=None)
+        df_state = rows.value
+        profile.lap('filter', rows=len(df_state))
 
         # Select columns for the Monte Carlo simulation
         st.subheader('Select columns for Monte Carlo simulation:')
-        X1_col = st.selectbox('Select column for X1', df.columns, index=df.columns.get_loc('GEN'))
-        X2_col = st.selectbox('Select column for X2', df.columns, index=df.columns.get_loc('PIPE'))
-        X3_col = st.selectbox('Select column for X3', df.columns, index=df.columns.get_loc('MARKET'))
-        X4_col = st.selectbox('Select column for X4', df.columns, index=df.columns.get_loc('INCENTIVES'))
-        X5_col = st.selectbox('Select column for X5', df.columns, index=df.columns.get_loc('WATER'))
+        criteria = criteria_columns(df)
+
+        # Paginated preview of the identifier and selected criteria columns
+        with preview:
+            dataset_preview(df, criteria)
+        profile.lap('preview', rows=len(df))
+
+        # Criteria of the selected rows
+        matrix = graph.node('column mapping', lambda view: criteria_matrix(view, criteria), rows, params=(criteria,))
 
         # Input sliders for weights
-        w1 = st.slider("Weight w1", 0, 100, 20) / 100.0
-        w2 = st.slider("Weight w2", 0, 100, 20) / 100.0
-        w3 = st.slider("Weight w3", 0, 100, 20) / 100.0
-        w4 = st.slider("Weight w4", 0, 100, 20) / 100.0
-        w5 = st.slider("Weight w5", 0, 100, 20) / 100.0
+        weights = weight_sliders(len(criteria))
+
+        # Criteria with no value anywhere in the selection cannot be resampled
+        empty = [column for column, blank in zip(criteria, np.isnan(matrix.value).all(axis=0)) if blank]
+        if empty:
+            st.error(f"No plant in this selection has a value for: {', '.join(empty)}.")
 
-        # Number of simulations
-        num_simulations = st.number_input('Number of simulations', min_value=100, max_value=10000, value=1000)
+        # Number of simulations and random seed (the same seed reproduces the same result)
+        num_simulations = st.number_input('Number of simulations', min_value=100, max_value=100_000_000, value=1_000_000)
+        seed = st.number_input('Random seed', min_value=0, value=DEFAULT_SEED, step=1)
 
         # Perform Monte Carlo simulation
-        if st.button('Run Simulation'):
-            X1_samples = np.random.choice(df_state[X1_col], num_simulations)
-            X2_samples = np.random.choice(df_state[X2_col], num_simulations)
-            X3_samples = np.random.choice(df_state[X3_col], num_simulations)
-            X4_samples = np.random.choice(df_state[X4_col], num_simulations)
-            X5_samples = np.random.choice(df_state[X5_col], num_simulations)
-
-            # Calculate Y for each simulation
-            Y_simulations = (w1 * X1_samples +
-                             w2 * X2_samples +
-                             w3 * X3_samples +
-                             w4 * X4_samples +
-                             w5 * X5_samples)
-
-            # Average Y value from simulations
-            Y_mean = np.mean(Y_simulations)
+        if st.button('Run Simulation') and not empty:
+            # Determine the viability threshold dynamically
+            threshold = graph.node('selection threshold', lambda X: scoring_threshold(np.nanmax(X, axis=0), weights),
+                                   matrix, params=(weights,), store=None).value
+
+            # Draw the simulations in chunks so memory stays constant
+            sim = graph.node('monte carlo',
+                             lambda X: simulate(X, weights, int(num_simulations), threshold, seed=int(seed)),
+                             matrix, params=(weights, int(num_simulations), int(seed))).value
+            Y_mean = sim.mean
 
             # Display results
             st.subheader('Simulation Results')
-            st.write(f'Average Y value from {num_simulations} simulations: {Y_mean}')
-
-            # Determine the viability threshold dynamically
-            max_Y = (w1 * df_state[X1_col].max() +
-                     w2 * df_state[X2_col].max() +
-                     w3 * df_state[X3_col].max() +
-                     w4 * df_state[X4_col].max() +
-                     w5 * df_state[X5_col].max())
-
-            threshold = max_Y * 0.75
+            st.write(f'Average Y value from {sim.draws} simulations: {Y_mean} '
+                     f'(standard error {sim.std_error:.3g}, seed {sim.seed})')
+            st.write(f'Probability that Y exceeds the viability threshold ({threshold:.3f}): {sim.p_viable:.2%}')
+            st.table({'Percentile': [f'P{q}' for q in sim.percentiles],
+                      'Y': list(sim.percentiles.values())})
 
             # Determine if the project is viable
             if Y_mean > threshold:
                 st.success("Viable Project")
             else:
                 st.warning("Not a viable project")
+            profile.lap('monte carlo', rows=sim.draws)
 
         # Box for user to input the size of the list
         list_size = st.number_input('Enter the size of the list', min_value=1, max_value=100, value=10, step=1)
 
-        # Calculate Y for all plants in the filtered dataframe
-        df_state.loc[:, 'Y'] = (w1 * df_state[X1_col] +
-                                w2 * df_state[X2_col] +
-                                w3 * df_state[X3_col] +
-                                w4 * df_state[X4_col] +
-                                w5 * df_state[X5_col])
-
-        # Recompute threshold for overall viability
-        overall_max_Y = (w1 * df[X1_col].max() +
-                         w2 * df[X2_col].max() +
-                         w3 * df[X3_col].max() +
-                         w4 * df[X4_col].max() +
-                         w5 * df[X5_col].max())
-
-        threshold = overall_max_Y * 0.75
-
-        df_state.loc[:, 'Viability'] = df_state['Y'].apply(lambda y: 'Viable' if y > threshold else 'Not Viable')
-
-        # Sort dataframe by Y in descending order and get the top entries
-        top_df = df_state.nlargest(list_size, 'Y')
+        # Top entries by Y (and their viability, against the threshold from the overall
+        # dataset) from the presorted top-k index
+        ranges = graph.node('column range', lambda frame: column_range(criteria_matrix(frame, criteria)), data,
+                            params=(criteria,))
+        limit = graph.node('threshold', lambda extent: scoring_threshold(extent[1], weights), ranges,
+                           params=(weights,), store=None)
+        top_df = top_scores(graph, df_state, matrix, weights, list_size, limit)
 
         # Display the top entries
         st.subheader('Top Y Scores:')
         st.dataframe(top_df[['PSTATABB', 'Plant county name', 'PNAME', 'Y', 'Viability']])
+        profile.lap('top-k', rows=len(df_state))
 
         # Sensitivity analysis
         st.subheader('Sensitivity Analysis')
 
-        sensitivity_results = {}
-
-        for column, min_val, max_val in [('GEN', 1, 5), ('PIPE', 4, 5), ('MARKET', 1, 5), ('INCENTIVES', 0, 1), ('WATER', 1, 5)]:
-            if column in df.columns:
-                sensitivity_values = []
-                for value in range(min_val, max_val + 1):
-                    df_state.loc[:, column] = value
-                    Y = (w1 * df_state[X1_col] +
-                         w2 * df_state[X2_col] +
-                         w3 * df_state[X3_col] +
-                         w4 * df_state[X4_col] +
-                         w5 * df_state[X5_col]).mean()
-                    sensitivity_values.append((value, Y))
-                sensitivity_results[column] = sensitivity_values
+        # One-at-a-time sweeps over the observed range of each selected criterion,
+        # computed from the linear model without modifying the data
+        sweeps = graph.node('sweep values', lambda frame: [sweep_values(frame[column]) for column in criteria],
+                            data, params=(criteria,))
+        sweep_means = graph.node('sensitivity sweep', lambda X, values: one_at_a_time(X, weights, values),
+                                 matrix, sweeps, params=(weights,)).value
+
+        sensitivity_results = {column: [(float(value), float(Y)) for value, Y in zip(values, means)]
+                               for column, values, means in zip(criteria, sweeps.value, sweep_means)}
 
         # Print the sensitivity analysis results
         st.write("Sensitivity Analysis Results:")
@@ -150,11 +133,26 @@ if uploaded_file is not None:
             st.write(f"{key}: {values}")
 
         st.write("Note: Each tuple represents (value, average Y)")
+        profile.lap('sensitivity sweep', rows=len(df_state))
+
+        # Variance-based (Sobol) indices: share of the variance of Y explained by each criterion
+        st.subheader('Global Sensitivity (Sobol Indices)')
+        sobol_samples = st.number_input('Saltelli base samples', min_value=1000, max_value=10_000_000,
+                                        value=SOBOL_SAMPLES, step=1000)
+        if not empty:
+            sobol = graph.node('sobol indices',
+                               lambda X: sobol_indices(X, weights, samples=int(sobol_samples), seed=int(seed)),
+                               matrix, params=(weights, int(sobol_samples), int(seed))).value
+            st.dataframe({'Criterion': criteria,
+                          'First-order index': sobol.first_order,
+                          'Total-order index': sobol.total_order})
+            profile.lap('sobol indices', rows=sobol.samples)
 
         # Interpretation of sensitivity analysis results
         st.subheader("Sensitivity Analysis Interpretation")
         interpretation_text = """
         The sensitivity analysis shows how changes in each input variable (GEN, PIPE, MARKET, INCENTIVES, WATER) impact the average \( Y \) score.
+        The first-order Sobol index is the share of the variance of \( Y \) explained by a criterion alone; the total-order index also includes its interactions.
 
         **GEN**:
         The scores for GEN range from 1 to 5. If the average \( Y \) score varies significantly as GEN changes, it indicates that GEN has a high impact on the project's viability.
@@ -177,3 +175,7 @@ if uploaded_file is not None:
         For example, if the \( Y \) score is highly sensitive to GEN and MARKET, more resources should be allocated to optimize these variables. Conversely, if the sensitivity to PIPE is low, it might be deprioritized in the project's strategy.
         """
         st.write(interpretation_text)
+
+show_cache_stats()
+show_graph(graph)
+show_profile(profile)
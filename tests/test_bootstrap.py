@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from viability.bootstrap import bootstrap_groups, group_codes
+
+
+def plants():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'PSTATABB': rng.choice(['TX', 'OH', 'NY'], size=600),
+                       'Plant county name': rng.choice(['C1', 'C2'], size=600)})
+    df.loc[5, 'Plant county name'] = None
+    # Each state's scores centre on a different level.
+    y = df['PSTATABB'].map({'TX': 3.0, 'OH': 2.0, 'NY': 1.0}).to_numpy() + rng.normal(0, 0.5, size=600)
+    return df, y
+
+
+def test_group_codes_number_groups_by_first_appearance():
+    df, _ = plants()
+    codes, labels = group_codes(df, ['PSTATABB', 'Plant county name'])
+    assert codes[5] == -1
+    assert labels[0] == ' / '.join(df.iloc[0])
+    first = [np.flatnonzero(codes == c)[0] for c in range(len(labels))]
+    assert first == sorted(first)
+
+
+def test_intervals_are_reproducible_and_bracket_the_estimate():
+    df, y = plants()
+    codes, labels = group_codes(df, ['PSTATABB'])
+    result = bootstrap_groups(y, y > 2.5, codes, labels, replicates=400, seed=1)
+    again = bootstrap_groups(y, y > 2.5, codes, labels, replicates=400, seed=1)
+    assert np.array_equal(result.mean_low, again.mean_low) and np.array_equal(result.viable_high, again.viable_high)
+    assert result.size.sum() == len(df)
+    assert ((result.mean_low <= result.mean) & (result.mean <= result.mean_high)).all()
+    assert ((result.viable_low <= result.viable) & (result.viable <= result.viable_high)).all()
+    expected = pd.Series(y).groupby(df['PSTATABB']).mean()
+    assert np.allclose(result.mean, expected[labels].to_numpy())
+    # The three state levels are well separated.
+    order = np.argsort(-result.mean)
+    assert [labels[i] for i in order] == ['TX', 'OH', 'NY']
+    assert (result.mean_low[order[:-1]] > result.mean_high[order[1:]]).all()
+
+
+def test_blank_scores_are_left_out():
+    df, y = plants()
+    codes, labels = group_codes(df, ['PSTATABB'])
+    complete = bootstrap_groups(y, y > 2.5, codes, labels, replicates=200, seed=1)
+    y[:3] = np.nan
+    result = bootstrap_groups(y, y > 2.5, codes, labels, replicates=200, seed=1)
+    assert result.size.sum() == len(df) - 3
+    assert np.isfinite(result.mean_low).all() and np.isfinite(result.viable_high).all()
+    assert np.allclose(result.mean, complete.mean, atol=0.05)
@@ -0,0 +1,60 @@
+from viability import dag
+from viability.cache import ByteLRU
+
+
+def run(previous, store, gen_weight, list_size, calls):
+    graph = dag.Graph('page', previous)
+    data = graph.source('ingest', 'dataset-1', [3, 1, 2])
+
+    def scoring(values):
+        calls.append('scoring')
+        return [v * gen_weight for v in values]
+
+    def top(scores):
+        calls.append('top-k')
+        return sorted(scores, reverse=True)[:list_size]
+
+    scores = graph.node('scoring', scoring, data, params=(gen_weight,), store=store)
+    best = graph.node('top-k', top, scores, params=(list_size,), store=store)
+    return graph, best.value
+
+
+def test_only_stages_downstream_of_a_change_rerun():
+    store = ByteLRU(2**20)
+    calls = []
+    graph, best = run(None, store, 2, 2, calls)
+    assert best == [6, 4] and calls == ['scoring', 'top-k']
+
+    calls.clear()
+    graph, best = run(graph.snapshot(), store, 2, 1, calls)
+    assert best == [6] and calls == ['top-k']
+    assert graph.nodes['scoring'].status == dag.CACHED
+    assert graph.changes(graph.nodes['top-k']) == ['parameters']
+
+    calls.clear()
+    graph, best = run(graph.snapshot(), store, 3, 1, calls)
+    assert best == [9] and calls == ['scoring', 'top-k']
+    assert graph.changes(graph.nodes['top-k']) == ['scoring']
+
+    calls.clear()
+    graph, best = run(graph.snapshot(), store, 2, 2, calls)
+    assert best == [6, 4] and calls == []
+    # A cached stage never asks for its inputs.
+    assert graph.nodes['top-k'].status == dag.CACHED
+    assert graph.nodes['scoring'].status == dag.SKIPPED
+
+
+def test_unstored_stages_carry_over_one_run():
+    calls = []
+    graph, _ = run(None, None, 2, 2, calls)
+    calls.clear()
+    graph, best = run(graph.snapshot(), None, 2, 2, calls)
+    assert best == [6, 4] and calls == []
+    calls.clear()
+    run(None, None, 2, 2, calls)
+    assert calls == ['scoring', 'top-k']
+
+
+def test_stage_keys_follow_the_code():
+    assert dag.stage_id(lambda x: x + 1) == dag.stage_id(lambda x: x + 1)
+    assert dag.stage_id(lambda x: x + 1) != dag.stage_id(lambda x: x + 2)
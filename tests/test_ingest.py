@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from viability.hierarchy import HierarchyIndex, sheet_order, sheet_positions
+from viability.ingest import compact
+
+
+def sheet():
+    return pd.DataFrame({
+        'PSTATABB': ['TX', 'OH', 'TX', 'OH', 'TX', 'OH'],
+        'Plant county name': ['Harris', 'Wood', 'Travis', 'Wood', 'Harris', 'Lake'],
+        'PNAME': ['E', 'B', 'C', 'D', 'A', 'F'],
+        'GEN': [1, 2, 3, 4, 5, 5],
+        'PIPE': [1.5, np.nan, 2.0, 3.0, 1.0, 4.5],
+        'BIG': [1, 2, 3, 4, 70_000, 5],
+        'SHARE': [0.1, 0.2, 0.3, 0.4, 0.5, 0.6],
+        'NOTE': ['x', 'y', 'z', 'w', 'v', 'u'],
+        'EMPTY': [np.nan] * 6,
+    })
+
+
+def test_compaction_dtypes():
+    compacted, report = compact(sheet())
+    dtypes = compacted.dtypes
+    assert all(isinstance(dtypes[c], pd.CategoricalDtype) for c in ['PSTATABB', 'Plant county name', 'PNAME'])
+    # Every value survives the downcast exactly.
+    assert dtypes['GEN'] == np.int8 and dtypes['BIG'] == np.int32
+    assert dtypes['PIPE'] == np.float32 and dtypes['SHARE'] == np.float64
+    assert report['dropped'] == ['NOTE', 'EMPTY']
+    original = sheet()
+    for column in ['GEN', 'PIPE', 'BIG', 'SHARE']:
+        assert compacted[column].sort_index().astype(np.float64).equals(original[column].astype(np.float64))
+
+
+def test_compaction_groups_rows_and_keeps_sheet_positions():
+    compacted, _ = compact(sheet())
+    # Grouped by state, then county, in order of first appearance; sheet order within a county.
+    assert compacted.index.tolist() == [0, 4, 2, 1, 3, 5]
+    positions = sheet_positions(compacted)
+    assert compacted.index[sheet_order(positions)].tolist() == list(range(6))
+
+
+def test_options_follow_the_sheet():
+    original = sheet()
+    index = HierarchyIndex(compact(original)[0])
+    assert index.states() == ['TX', 'OH']
+    assert index.counties() == ['Harris', 'Wood', 'Travis', 'Lake']
+    assert index.counties('OH') == ['Wood', 'Lake']
+    assert index.plants() == original['PNAME'].tolist()
+    assert index.plants('TX') == ['E', 'C', 'A']
+    assert index.plants(county='Harris') == ['E', 'A']
+    assert sorted(index.select('OH', 'Wood')['PNAME']) == ['B', 'D']
+    assert index.select('TX', plant='C')['PNAME'].tolist() == ['C']
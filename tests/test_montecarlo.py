@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from viability import montecarlo
+from viability.montecarlo import plant_viability, simulate, simulate_until
+
+WEIGHTS = [0.4, 0.3, 0.2, 0.1]
+
+
+def plants(n=3_000, blank=0.0):
+    rng = np.random.default_rng(0)
+    X = rng.random((n, 4))
+    X[rng.random(X.shape) < blank] = np.nan
+    return X
+
+
+@pytest.mark.parametrize('joint', [False, True])
+def test_seed_reproduces_the_result(joint):
+    X = plants()
+    first = simulate(X, WEIGHTS, 50_000, 0.5, seed=7, chunk_size=10_000, joint=joint)
+    assert first == simulate(X, WEIGHTS, 50_000, 0.5, seed=7, chunk_size=10_000, joint=joint)
+    assert first.mean != simulate(X, WEIGHTS, 50_000, 0.5, seed=8, chunk_size=10_000, joint=joint).mean
+    for sampler in ('sobol', 'lhs', 'random'):
+        runs = [simulate_until(X, WEIGHTS, 0.5, tolerance=2e-3, sampler=sampler, seed=7, joint=joint)
+                for _ in range(2)]
+        assert runs[0].simulation == runs[1].simulation
+        assert runs[0].history == runs[1].history
+
+
+@pytest.fixture
+def process_pool():
+    yield
+    if montecarlo._executor is not None:
+        montecarlo._executor.shutdown()
+        montecarlo._executor = None
+
+
+def test_plant_viability_does_not_depend_on_the_processes(process_pool):
+    X = plants(400)
+    serial = plant_viability(X, WEIGHTS, 0.5, draws=200, seed=3, batch_size=64, parallel=False)
+    assert np.array_equal(serial, plant_viability(X, WEIGHTS, 0.5, draws=200, seed=3, batch_size=64, parallel=True))
+    assert ((serial >= 0) & (serial <= 1)).all()
+
+
+@pytest.mark.parametrize('joint', [False, True])
+def test_blank_cells_are_never_drawn(joint):
+    X = plants(blank=0.01)
+    sim = simulate(X, WEIGHTS, 100_000, 0.5, joint=joint)
+    assert np.isfinite([sim.mean, sim.std, *sim.percentiles.values()]).all()
+    assert 0.45 < sim.mean < 0.55
+    run = simulate_until(X, WEIGHTS, 0.5, tolerance=1e-3, sampler='random', joint=joint)
+    assert np.isfinite(run.simulation.mean) and run.converged
+
+
+def test_criterion_without_values_is_reported():
+    X = plants(10)
+    X[:, 2] = np.nan
+    with pytest.raises(ValueError):
+        simulate(X, WEIGHTS, 1_000, 0.5)
+    with pytest.raises(ValueError):
+        simulate(X, WEIGHTS, 1_000, 0.5, joint=True)
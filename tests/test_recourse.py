@@ -0,0 +1,33 @@
+import numpy as np
+
+from viability.recourse import minimum_change
+from viability.scoring import evaluate
+
+WEIGHTS = [0.2] * 5
+COLUMN_MAX = np.array([5, 5, 5, 1, 5], dtype=np.float64)
+
+
+def test_changes_reach_the_threshold():
+    rng = np.random.default_rng(0)
+    X = rng.integers(1, 6, size=(500, 5)).astype(np.float64)
+    X[:, 3] = rng.integers(0, 2, size=500)
+    change = minimum_change(X, WEIGHTS, COLUMN_MAX)
+    pending = change.gap > 0
+    fixable = pending & ~np.isnan(change.score_total)
+    lifted = evaluate(X[fixable] + change.score_change[fixable], WEIGHTS, COLUMN_MAX)
+    assert np.allclose(lifted.y, lifted.threshold)
+    # Weight changes keep the total and reach the threshold with the old scores.
+    reweighted = change.weights[pending & ~np.isnan(change.weight_shift)]
+    assert np.allclose(reweighted.sum(axis=1), 1.0)
+    A = X[pending & ~np.isnan(change.weight_shift)] - 0.75 * COLUMN_MAX
+    assert (np.einsum('ij,ij->i', reweighted, A) >= -1e-9).all()
+    assert (change.weight_shift[~pending] == 0).all()
+
+
+def test_blank_cell_needs_no_change_it_cannot_have():
+    X = np.array([[5, 5, 4, 1, 5], [np.nan, 1, 1, 0, 1], [1, 1, 1, 0, 1]], dtype=np.float64)
+    change = minimum_change(X, WEIGHTS, COLUMN_MAX)
+    assert np.isnan(change.gap[1])
+    assert np.isnan(change.score_total[1]) and np.isnan(change.weight_shift[1])
+    assert np.isnan(change.weights[1]).all()
+    assert change.weight_shift[0] == 0
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from viability import scenarios
+from viability.scoring import evaluate
+from viability.topk import top_k
+
+WEIGHTS = np.array([[0.15, 0.35, 0.2, 0.2, 0.1],
+                    [0.2, 0.2, 0.2, 0.2, 0.2],
+                    [0.14, 0.51, 0.06, 0.05, 0.24]]).T
+
+
+def whole_number_plants(n=20_000):
+    # 1..5 scales put many plants exactly on a threshold.
+    rng = np.random.default_rng(0)
+    X = rng.integers(1, 6, size=(n, 5)).astype(np.float64)
+    X[rng.random(n) < 0.01, 2] = np.nan
+    return X
+
+
+@pytest.mark.parametrize('chunk', [1 << 22, 1000])
+def test_viability_matches_evaluate(monkeypatch, chunk):
+    monkeypatch.setattr(scenarios, 'CHUNK_ELEMENTS', chunk)
+    X = whole_number_plants()
+    column_max = np.nanmax(X, axis=0)
+    results = scenarios.evaluate_scenarios(X, WEIGHTS, [0.75] * 3, column_max)
+    expected = np.array([evaluate(X, w, column_max).viable for w in WEIGHTS.T]).T
+    assert results.viable.tolist() == expected.sum(axis=0).tolist()
+    assert results.viable_in.tolist() == expected.sum(axis=1).tolist()
+    assert (scenarios.viable_matrix(X, WEIGHTS, results.thresholds) == expected).all()
+    for j, w in enumerate(WEIGHTS.T):
+        assert np.allclose(results.top_scores[j], top_k(X, w, 10).scores)
+
+
+def test_small_selection_with_blank_cell():
+    # Fewer plants than the list size, one of them with a blank cell.
+    X = whole_number_plants(6)
+    X[4, 0] = np.nan
+    results = scenarios.evaluate_scenarios(X, WEIGHTS, [0.75] * 3, np.nanmax(X, axis=0), k=10)
+    assert results.top_rows.shape == (3, 5)
+    assert 4 not in results.top_rows
+    assert not np.isnan(results.top_scores).any()
+    assert results.viable_in[4] == 0
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+from viability.scoring import DEFAULT_CRITERIA, column_range, criteria_matrix, evaluate, labels, score
+from viability.topk import TopKIndex, search_pays, top_k
+
+WEIGHTS = [0.2] * 5
+
+
+def plants_with_blank_cell():
+    # Plant B has a blank GEN cell; the others span the 1..5 (0..1 for INCENTIVES) scale.
+    return pd.DataFrame({
+        'PNAME': ['A', 'B', 'C', 'D'],
+        'GEN': [5, np.nan, 1, 4],
+        'PIPE': [5, 5, 1, 4],
+        'MARKET': [4, 5, 1, 5],
+        'INCENTIVES': [1, 1, 0, 1],
+        'WATER': [5, 5, 1, 5],
+    })
+
+
+def test_column_range_skips_blank_cells():
+    low, high = column_range(criteria_matrix(plants_with_blank_cell(), DEFAULT_CRITERIA))
+    assert low.tolist() == [1, 1, 1, 0, 1]
+    assert high.tolist() == [5, 5, 5, 1, 5]
+
+
+def test_threshold_ignores_blank_cells():
+    X = criteria_matrix(plants_with_blank_cell(), DEFAULT_CRITERIA)
+    result = evaluate(X, WEIGHTS)
+    assert np.isfinite(result.threshold)
+    assert np.isclose(result.threshold, 0.75 * 4.2)
+    # Plant A scores 4.0 of a possible 4.2 and stays viable; the blank row never is.
+    assert labels(result.viable).tolist() == ['Viable', 'Not Viable', 'Not Viable', 'Viable']
+
+
+def test_ranking_skips_blank_scores():
+    X = criteria_matrix(plants_with_blank_cell(), DEFAULT_CRITERIA)
+    for top in (top_k(X, WEIGHTS, 3), TopKIndex(X).query(WEIGHTS, 3)):
+        assert top.rows.tolist() == [0, 3, 2]
+        assert not np.isnan(top.scores).any()
+    assert top_k(X, WEIGHTS, 10).rows.tolist() == [0, 3, 2]
+
+
+def test_index_search_matches_scan_with_blank_cells():
+    rng = np.random.default_rng(0)
+    # Correlated criteria spread out at the top, so the search stops early.
+    X = rng.lognormal(size=(20_000, 1)) + rng.random((20_000, 5))
+    X[rng.random(X.shape) < 0.01] = np.nan
+    expected = top_k(X, WEIGHTS, 10)
+    found = TopKIndex(X).query(WEIGHTS, 10)
+    assert found.method == 'threshold'
+    assert found.rows.tolist() == expected.rows.tolist()
+    assert not np.isnan(found.scores).any()
+
+
+def test_tied_scales_skip_the_threshold_search():
+    rng = np.random.default_rng(0)
+    X = rng.integers(1, 6, size=(20_000, 5)).astype(np.float64)
+    assert not search_pays(X, WEIGHTS, 10)
+    found = TopKIndex(X).query(WEIGHTS, 10)
+    assert found.method == 'scan'
+    assert found.rows.tolist() == top_k(X, WEIGHTS, 10).rows.tolist()
+
+
+def test_ties_follow_sheet_positions():
+    # A view regrouped away from sheet order: ties go to the plant first in the sheet.
+    rng = np.random.default_rng(0)
+    X = rng.integers(1, 6, size=(5_000, 5)).astype(np.float64)
+    positions = rng.permutation(len(X))
+    sheet = np.empty_like(X)
+    sheet[positions] = X
+    expected = pd.Series(score(sheet, WEIGHTS)).nlargest(12).index.tolist()
+    for top in (top_k(X, WEIGHTS, 12, positions), TopKIndex(X).query(WEIGHTS, 12, positions=positions)):
+        assert positions[top.rows].tolist() == expected
@@ -0,0 +1,20 @@
+import numpy as np
+
+from viability.sensitivity import one_at_a_time, sobol_indices, sweep_values
+
+WEIGHTS = [0.5, 0.3, 0.2]
+
+
+def test_blank_cells_are_left_out():
+    rng = np.random.default_rng(0)
+    X = rng.random((2_000, 3))
+    X[rng.random(X.shape) < 0.01] = np.nan
+    sweeps = [sweep_values(X[:, j]) for j in range(3)]
+    for means in one_at_a_time(X, WEIGHTS, sweeps):
+        assert np.isfinite(means).all()
+    sobol = sobol_indices(X, WEIGHTS, samples=4_096)
+    assert np.isfinite(sobol.first_order).all() and np.isfinite(sobol.total_order).all()
+    # Independent uniform criteria: each index is its share of w_j^2.
+    share = np.square(WEIGHTS) / np.square(WEIGHTS).sum()
+    assert np.allclose(sobol.total_order, share, atol=0.05)
+
@@ -0,0 +1,48 @@
+import json
+
+import numpy as np
+import pandas as pd
+from tornado.testing import AsyncHTTPTestCase
+
+from viability.server import Dataset, make_app
+
+
+def strict(constant):
+    raise ValueError(f'{constant} is not JSON')
+
+
+def plants():
+    return pd.DataFrame({
+        'PSTATABB': ['TX', 'TX', 'OH'],
+        'Plant county name': ['Harris', 'Travis', 'Wood'],
+        'PNAME': ['A', 'B', 'C'],
+        'GEN': [5, np.nan, 1],
+        'PIPE': [5, 5, 1],
+        'MARKET': [4, 5, 1],
+        'INCENTIVES': [1, 1, 0],
+        'WATER': [5, 5, 1],
+    })
+
+
+class ServerTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        return make_app(Dataset(plants(), 'plants'), workers=1)
+
+    def post(self, path, body):
+        response = self.fetch(path, method='POST', body=body if isinstance(body, str) else json.dumps(body))
+        return response.code, json.loads(response.body, parse_constant=strict)
+
+    def test_invalid_numbers_are_bad_requests(self):
+        for path, body in [('/topk', {'k': 'ten'}), ('/topk', '{"k": NaN}'), ('/topk', {'k': 0}),
+                           ('/montecarlo', {'draws': 'many'}), ('/montecarlo', {'seed': 'x'}),
+                           ('/montecarlo', {'seed': -1}), ('/score', {'criteria': []})]:
+            code, reply = self.post(path, body)
+            assert code == 400, (path, body, reply)
+            assert reply['error']
+
+    def test_blank_score_is_null(self):
+        code, reply = self.post('/score', {'plants': ['B']})
+        assert code == 200
+        assert reply['plants'][0]['Y'] is None
+        assert reply['plants'][0]['Viability'] == 'Not Viable'
@@ -0,0 +1,6 @@
+"""Shared building blocks for the weighted-rank viability pages.
+
+The Streamlit scripts in ``app.py`` and ``pages/`` stay thin; dataset
+ingest, caching and the numeric work live in this package so every page
+(and anything run outside Streamlit) uses the same code.
+"""
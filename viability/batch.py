@@ -0,0 +1,164 @@
+"""Headless batch scoring.
+
+Scores a CSV, Excel or Parquet export chunk by chunk with the same
+weighted-rank viability logic as the pages and writes Parquet partitioned
+by state (``PSTATABB``)::
+
+    python -m viability.batch plants.csv --output scored/ --weights 0.3 0.2 0.2 0.2 0.1
+
+A first pass settles one Arrow schema for every output part (a column that
+is blank or numeric in some chunks and text in others is written as text
+throughout) and finds the criteria maxima (the threshold is 75% of the best
+achievable score, as on the pages); pass ``--column-max`` to fix the scale
+instead, e.g. ``--column-max 5 5 5 5 1`` for the one used by ``app.py``.
+Chunks are then scored, cast to the schema and written by a process pool
+while the main process keeps reading.
+"""
+
+import argparse
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from viability.ingest import CHUNK_ROWS, iter_chunks
+from viability.scoring import DEFAULT_CRITERIA, VIABILITY_FRACTION, criteria_matrix, evaluate, labels
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PARTITION_COLUMN = 'PSTATABB'
+
+
+def _common_type(a, b):
+    """Arrow type holding values of both ``a`` and ``b``; text when they disagree."""
+    import pyarrow as pa
+
+    if pa.types.is_null(a):
+        return b
+    if pa.types.is_null(b) or a == b:
+        return a
+    if pa.types.is_integer(a) and pa.types.is_integer(b):
+        return pa.int64()
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in (a, b)):
+        return pa.float64()
+    return pa.string()
+
+
+def first_pass(path, criteria, chunksize=CHUNK_ROWS):
+    """Arrow schema and criteria maxima of ``path`` from one read.
+
+    Each chunk infers its own types, so they are merged column by column
+    into the schema every part is written with.
+    """
+    import pyarrow as pa
+
+    types = {}
+    maxima = np.full(len(criteria), -np.inf)
+    for chunk in iter_chunks(path, chunksize=chunksize):
+        for field in pa.Schema.from_pandas(chunk, preserve_index=False):
+            types[field.name] = _common_type(types.get(field.name, pa.null()), field.type)
+        np.maximum(maxima, np.nanmax(criteria_matrix(chunk, criteria), axis=0, initial=-np.inf), out=maxima)
+    # Columns blank in every chunk are still written, as text.
+    schema = pa.schema([(name, pa.string() if pa.types.is_null(t) else t) for name, t in types.items()])
+    return schema, maxima
+
+
+def _as_table(chunk, schema):
+    """``chunk`` converted to ``schema``."""
+    import pyarrow as pa
+
+    columns = {}
+    for field in schema:
+        column = chunk[field.name]
+        if pa.types.is_string(field.type) and not pd.api.types.is_string_dtype(column):
+            # Blank or numeric in this chunk, text elsewhere in the file.
+            column = column.astype(object).where(column.notna(), None)
+            column = column.map(lambda value: value if value is None else str(value))
+        columns[field.name] = column
+    return pa.Table.from_pandas(pd.DataFrame(columns), schema=schema, preserve_index=False)
+
+
+def score_chunk(chunk, criteria, weights, column_max, fraction, output, part, schema):
+    """Score one chunk and append it to the partitioned Parquet output."""
+    import pyarrow.parquet as pq
+
+    result = evaluate(criteria_matrix(chunk, criteria), weights, column_max, fraction)
+    chunk = chunk.assign(Y=result.y, Viability=labels(result.viable))
+    pq.write_to_dataset(_as_table(chunk, schema), output, partition_cols=[PARTITION_COLUMN],
+                        basename_template=f'part-{part:05d}-{{i}}.parquet')
+    return len(chunk)
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process and its finished workers, in MB."""
+    if resource is None:
+        return float('nan')
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    scale = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * scale / 2**20
+
+
+def run(path, output, criteria=DEFAULT_CRITERIA, weights=None, column_max=None,
+        fraction=VIABILITY_FRACTION, chunksize=CHUNK_ROWS, workers=None):
+    """Score ``path`` into ``output``; returns ``(rows, seconds)``."""
+    criteria = list(criteria)
+    weights = np.full(len(criteria), 1 / len(criteria)) if weights is None else np.asarray(weights, dtype=float)
+    if weights.size != len(criteria):
+        raise ValueError(f'Got {weights.size} weights for {len(criteria)} criteria.')
+    Path(output).mkdir(parents=True, exist_ok=True)
+
+    import pyarrow as pa
+
+    start = time.perf_counter()
+    schema, maxima = first_pass(path, criteria, chunksize)
+    if column_max is None:
+        column_max = maxima
+    # Read text columns as text, so a chunk where they look numeric keeps the file's spelling.
+    text = {field.name: str for field in schema if pa.types.is_string(field.type)}
+    schema = schema.append(pa.field('Y', pa.float64())).append(pa.field('Viability', pa.string()))
+
+    rows = 0
+    with ProcessPoolExecutor(workers) as pool:
+        limit = 2 * pool._max_workers
+        pending = set()
+        for part, chunk in enumerate(iter_chunks(path, chunksize=chunksize, dtype=text)):
+            # Bound the chunks in flight so memory does not grow with the file.
+            if len(pending) >= limit:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                rows += sum(f.result() for f in done)
+            pending.add(pool.submit(score_chunk, chunk, criteria, weights, column_max, fraction, output, part,
+                                    schema))
+        rows += sum(f.result() for f in pending)
+    return rows, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m viability.batch', description=__doc__.split('\n\n')[0])
+    parser.add_argument('input', help='CSV, XLSX or Parquet file')
+    parser.add_argument('--output', required=True, help='directory for the partitioned Parquet output')
+    parser.add_argument('--criteria', nargs='+', default=DEFAULT_CRITERIA, help='criteria columns X1..XK')
+    parser.add_argument('--weights', nargs='+', type=float, help='one weight per criterion (default: equal)')
+    parser.add_argument('--column-max', nargs='+', type=float,
+                        help='maximum score per criterion (default: maxima found in the input)')
+    parser.add_argument('--fraction', type=float, default=VIABILITY_FRACTION,
+                        help='viability threshold as a fraction of the maximum score')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    args = parser.parse_args(argv)
+
+    rows, seconds = run(args.input, args.output, args.criteria, args.weights, args.column_max,
+                        args.fraction, args.chunk_size, args.workers)
+    print(f'Scored {rows:,} rows in {seconds:.1f}s ({rows / max(seconds, 1e-9):,.0f} rows/s), '
+          f'peak memory {peak_memory_mb():.0f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""Benchmark the stages the pages run, on synthetic plant datasets.
+
+Generates datasets shaped like the uploads (PSTATABB, Plant county name,
+PNAME and the five criteria) at several sizes, times each stage and writes
+the results as JSON. Comparing against an earlier run flags stages whose
+median time regressed::
+
+    python -m viability.benchmark --sizes 10000 100000 1000000 --output bench.json
+    python -m viability.benchmark --output new.json --compare bench.json
+
+The ingest stages time the upload path the pages use: hashing the bytes,
+parsing them in chunks, compacting the frame and registering it (in a
+scratch registry). Writing and parsing Excel is slow at large sizes, so the
+Excel ingest stage only runs up to ``--excel-max-rows``.
+"""
+
+import argparse
+import io
+import itertools
+import json
+import platform
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from viability import ingest, montecarlo, registry, sensitivity
+from viability.hierarchy import HierarchyIndex
+from viability.scoring import DEFAULT_CRITERIA, criteria_matrix, evaluate, labels
+from viability.topk import TopKIndex, top_k
+
+SIZES = (10_000, 100_000, 1_000_000)
+REPEATS = 5
+EXCEL_MAX_ROWS = 100_000
+TOLERANCE = 0.2
+WEIGHTS = np.array([0.3, 0.2, 0.2, 0.2, 0.1])
+# Score ranges of the criteria as used on the Sensitivity page.
+CRITERIA_RANGES = {'GEN': (1, 5), 'PIPE': (4, 5), 'MARKET': (1, 5), 'INCENTIVES': (0, 1), 'WATER': (1, 5)}
+STATES = ('AL', 'AZ', 'CA', 'CO', 'FL', 'GA', 'IL', 'LA', 'MI', 'NY', 'OH', 'PA', 'TX', 'WA', 'WY')
+
+
+def synthetic_plants(rows, seed=0, counties_per_state=60):
+    """Random dataset with the columns and value ranges of an upload."""
+    rng = np.random.default_rng(seed)
+    state = rng.choice(STATES, rows)
+    county = rng.integers(0, counties_per_state, rows)
+    data = {
+        'PSTATABB': state,
+        'Plant county name': np.char.add('County ', county.astype(str)),
+        'PNAME': np.char.add('Plant ', np.arange(rows).astype(str)),
+    }
+    for column, (low, high) in CRITERIA_RANGES.items():
+        data[column] = rng.integers(low, high + 1, rows)
+    return pd.DataFrame(data)
+
+
+def _time(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': float(np.median(times)), 'repeats': repeats}
+
+
+@contextmanager
+def _scratch_registry(directory):
+    """Register datasets in ``directory`` instead of the shared registry."""
+    shared = registry.REGISTRY_DIR
+    registry.REGISTRY_DIR = Path(directory)
+    try:
+        yield
+    finally:
+        # Unmap and delete everything registered here before switching back.
+        registry.evict(0)
+        registry.REGISTRY_DIR = shared
+
+
+def _ingest(data, kind, name, runs):
+    """Hash, parse, compact and register an upload as the load job does."""
+    # A fresh key per run, so every run writes the registry file again.
+    key = f'{ingest.dataset_key(data)}-{next(runs)}'
+    df, _ = ingest.compact(ingest.parse(io.BytesIO(data), kind))
+    return registry.register(key, df, name)
+
+
+def run_size(rows, repeats=REPEATS, excel_max_rows=EXCEL_MAX_ROWS, draws=1_000_000, workdir=None):
+    df = synthetic_plants(rows)
+    criteria = list(DEFAULT_CRITERIA)
+    results = {}
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp, _scratch_registry(Path(tmp) / 'registry'):
+        runs = itertools.count()
+        parquet = io.BytesIO()
+        df.to_parquet(parquet, index=False)
+        parquet = parquet.getvalue()
+        results['ingest_parquet'] = _time(lambda: _ingest(parquet, 'parquet', 'plants.parquet', runs), repeats)
+        if rows <= excel_max_rows:
+            excel = io.BytesIO()
+            df.to_excel(excel, index=False)
+            excel = excel.getvalue()
+            results['ingest_excel'] = _time(lambda: _ingest(excel, 'xlsx', 'plants.xlsx', runs),
+                                            max(1, repeats // 2))
+
+    state = STATES[0]
+    county = df.loc[df['PSTATABB'] == state, 'Plant county name'].iloc[0]
+    results['filter_mask'] = _time(
+        lambda: df[(df['PSTATABB'] == state) & (df['Plant county name'] == county)]['PNAME'].unique(), repeats)
+    results['filter_index_build'] = _time(lambda: HierarchyIndex(df), max(1, repeats // 2))
+    index = HierarchyIndex(df)
+    results['filter_index_query'] = _time(
+        lambda: (index.counties(state), index.plants(state, county), index.select(state, county)), repeats)
+
+    X = criteria_matrix(df, criteria)
+    results['scoring'] = _time(lambda: evaluate(X, WEIGHTS), repeats)
+    scores = evaluate(X, WEIGHTS)
+    results['viability_labels'] = _time(lambda: labels(scores.viable), repeats)
+
+    results['topk_nlargest'] = _time(lambda: pd.Series(scores.y).nlargest(10), repeats)
+    results['topk_scan'] = _time(lambda: top_k(X, WEIGHTS, 10), repeats)
+    results['topk_index_build'] = _time(lambda: TopKIndex(X), max(1, repeats // 2))
+    topk_index = TopKIndex(X)
+    results['topk_index_query'] = _time(lambda: topk_index.query(WEIGHTS, 10), repeats)
+
+    results['monte_carlo'] = _time(lambda: montecarlo.simulate(X, WEIGHTS, draws, scores.threshold), repeats)
+    sweeps = [sensitivity.sweep_values(X[:, j]) for j in range(len(criteria))]
+    results['sensitivity_sweep'] = _time(lambda: sensitivity.one_at_a_time(X, WEIGHTS, sweeps), repeats)
+    results['sensitivity_sobol'] = _time(lambda: sensitivity.sobol_indices(X, WEIGHTS), repeats)
+    return results
+
+
+def compare(current, baseline, tolerance=TOLERANCE):
+    """Stages whose median time grew by more than ``tolerance`` over ``baseline``."""
+    regressions = []
+    for size, stages in current['results'].items():
+        for stage, timing in stages.items():
+            before = baseline.get('results', {}).get(size, {}).get(stage)
+            if before and timing['median'] > before['median'] * (1 + tolerance):
+                regressions.append({'size': size, 'stage': stage, 'baseline': before['median'],
+                                    'current': timing['median'], 'ratio': timing['median'] / before['median']})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m viability.benchmark', description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES)
+    parser.add_argument('--repeats', type=int, default=REPEATS)
+    parser.add_argument('--excel-max-rows', type=int, default=EXCEL_MAX_ROWS)
+    parser.add_argument('--draws', type=int, default=1_000_000, help='Monte Carlo draws per run')
+    parser.add_argument('--output', required=True, help='JSON file for the results')
+    parser.add_argument('--compare', help='earlier results JSON to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='allowed slowdown of the median before a stage counts as regressed')
+    args = parser.parse_args(argv)
+
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'numpy': np.__version__, 'pandas': pd.__version__},
+        'results': {},
+    }
+    for rows in args.sizes:
+        print(f'Benchmarking {rows:,} rows...', flush=True)
+        report['results'][str(rows)] = run_size(rows, args.repeats, args.excel_max_rows, args.draws)
+        for stage, timing in report['results'][str(rows)].items():
+            print(f'  {stage:<22} {timing["median"] * 1000:10.2f} ms')
+
+    if args.compare:
+        report['regressions'] = compare(report, json.loads(Path(args.compare).read_text()), args.tolerance)
+    Path(args.output).write_text(json.dumps(report, indent=2))
+
+    for r in report.get('regressions', []):
+        print(f'REGRESSION {r["stage"]} at {r["size"]} rows: {r["baseline"] * 1000:.2f} ms -> '
+              f'{r["current"] * 1000:.2f} ms ({r["ratio"]:.2f}x)')
+    return 1 if report.get('regressions') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
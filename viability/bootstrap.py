@@ -0,0 +1,105 @@
+"""Bootstrap confidence intervals for mean Y and viable share per group.
+
+Each replicate resamples the plants of every group (state or county) with
+replacement, keeping the group sizes. One index array per batch of
+replicates picks whole rows, so the criteria of a plant stay together;
+since Y is linear in a row, gathering each row's score is the same as
+gathering its K criteria and scoring them. Per-group means for all
+replicates of a batch come out of a single ``np.bincount`` over
+``replicate * groups + group``, with no loop over groups.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from viability.montecarlo import DEFAULT_SEED
+
+REPLICATES = 1000
+CONFIDENCE = 0.95
+# Upper bound on the resampled rows held by one batch of replicates.
+CHUNK_ELEMENTS = 1 << 22
+
+
+class GroupIntervals(NamedTuple):
+    groups: list
+    size: np.ndarray
+    mean: np.ndarray
+    mean_low: np.ndarray
+    mean_high: np.ndarray
+    viable: np.ndarray
+    viable_low: np.ndarray
+    viable_high: np.ndarray
+    replicates: int
+
+
+def group_codes(df, levels):
+    """Integer group per row for the combination of ``levels``, plus the group labels.
+
+    Groups are numbered in order of first appearance; rows missing any
+    level get ``-1``.
+    """
+    combined = np.zeros(len(df), dtype=np.int64)
+    missing = np.zeros(len(df), dtype=bool)
+    for level in levels:
+        level_codes, uniques = pd.factorize(df[level])
+        missing |= level_codes < 0
+        combined = combined * (len(uniques) + 1) + level_codes
+    present = np.flatnonzero(~missing)
+    codes = np.full(len(df), -1, dtype=np.int64)
+    codes[present], _ = pd.factorize(combined[present])
+    first = present[np.unique(codes[present], return_index=True)[1]]
+    labels = [' / '.join(map(str, row)) for row in df[list(levels)].iloc[first].itertuples(index=False)]
+    return codes, labels
+
+
+def bootstrap_groups(y, viable, codes, labels, replicates=REPLICATES, seed=DEFAULT_SEED,
+                     confidence=CONFIDENCE):
+    """Percentile bootstrap intervals of mean Y and viable share for every group.
+
+    ``y`` and ``viable`` hold each plant's score and viability, ``codes``
+    its group (``-1`` to leave it out) as returned by ``group_codes``.
+    Plants scoring NaN (a blank criterion cell) are left out as well; a
+    group with no scored plant gets NaN estimates.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    viable = np.asarray(viable, dtype=np.float64)
+    codes = np.asarray(codes, dtype=np.int64)
+    keep = (codes >= 0) & ~np.isnan(y)
+    y, viable, codes = y[keep], viable[keep], codes[keep]
+    g = len(labels)
+    size = np.bincount(codes, minlength=g)
+    n = len(codes)
+
+    # Rows of each group are contiguous in ``order``; a resampled row for
+    # position i of group c is order[start[c] + floor(u * size[c])].
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    start = np.concatenate([[0], np.cumsum(size)[:-1]])
+    span = size[sorted_codes]
+    base = start[sorted_codes]
+
+    # A group without a scored plant divides by NaN instead of zero.
+    denominator = np.where(size > 0, size, np.nan)
+
+    rng = np.random.default_rng(seed)
+    means = np.empty((replicates, g))
+    shares = np.empty((replicates, g))
+    step = max(1, CHUNK_ELEMENTS // max(1, n))
+    for first in range(0, replicates, step):
+        b = min(step, replicates - first)
+        rows = order[base + (rng.random((b, n)) * span).astype(np.int64)]
+        bins = (np.arange(b)[:, None] * g + sorted_codes).ravel()
+        counts = np.repeat(denominator[None, :], b, axis=0)
+        means[first:first + b] = np.bincount(bins, weights=y[rows].ravel(), minlength=b * g).reshape(b, g) / counts
+        shares[first:first + b] = (np.bincount(bins, weights=viable[rows].ravel(), minlength=b * g)
+                                   .reshape(b, g) / counts)
+
+    tails = [50 * (1 - confidence), 50 * (1 + confidence)]
+    mean_low, mean_high = np.percentile(means, tails, axis=0)
+    viable_low, viable_high = np.percentile(shares, tails, axis=0)
+    return GroupIntervals(list(labels), size,
+                          np.bincount(codes, weights=y, minlength=g) / denominator, mean_low, mean_high,
+                          np.bincount(codes, weights=viable, minlength=g) / denominator, viable_low, viable_high,
+                          replicates)
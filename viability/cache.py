@@ -0,0 +1,120 @@
+"""Byte-bounded LRU cache used for parsed datasets and derived results."""
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+RESULT_BUDGET = int(os.environ.get('VIABILITY_RESULT_CACHE_MB', 256)) * 2**20
+
+
+def sizeof(value):
+    """Best-effort size in bytes of a cached value."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (tuple, list)):
+        return sum(sizeof(item) for item in value)
+    if isinstance(value, dict):
+        return sum(sizeof(item) for item in value.values())
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+class ByteLRU:
+    """Least-recently-used mapping whose total size is capped in bytes.
+
+    Streamlit runs every session in its own thread of the same process, so
+    all access goes through a lock. Values are shared between sessions and
+    must be treated as read-only by callers.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return self._items[key][0]
+
+    def put(self, key, value, nbytes=None):
+        nbytes = sizeof(value) if nbytes is None else int(nbytes)
+        with self._lock:
+            if key in self._items:
+                self._bytes -= self._items.pop(key)[1]
+            # Values larger than the whole budget are returned to the caller
+            # but never stored, otherwise they would evict everything else.
+            if nbytes > self.max_bytes:
+                return value
+            self._items[key] = (value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self._bytes -= evicted
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            value, nbytes = self._items.pop(key)
+            self._bytes -= nbytes
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._items),
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+# Derived results (scores, top-k tables, simulations, ...) shared by all pages
+# and sessions of this process.
+results = ByteLRU(RESULT_BUDGET)
+
+
+def result_key(*parts):
+    """Hashable key from ``parts``, turning arrays and lists into tuples."""
+    def freeze(part):
+        if isinstance(part, np.ndarray):
+            return tuple(part.ravel().tolist())
+        if isinstance(part, (list, tuple)):
+            return tuple(freeze(p) for p in part)
+        if isinstance(part, np.generic):
+            return part.item()
+        return part
+    return tuple(freeze(p) for p in parts)
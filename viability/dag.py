@@ -0,0 +1,168 @@
+"""Incremental recomputation of a page's stages.
+
+Streamlit reruns a page top to bottom on every interaction. Pages instead
+declare their stages (ingest, filter, column mapping, scoring, threshold,
+top-k, simulation, sensitivity, ...) as nodes of a small dependency graph.
+A node is keyed on its name, the code that computes it, its own
+parameters (the widget values it reads) and the keys of the nodes it takes
+as inputs, so its key changes exactly when something upstream of it
+changed. Values are memoized on that key in the shared result cache and
+evaluated lazily: a node whose value is cached never asks for its inputs,
+so changing the list size reruns the top-k query and nothing above it.
+Stages named alike on different pages share cached values only when they
+run the same code.
+
+Each graph records, per node, whether this run served it from the cache,
+recomputed it or did not need it, and what changed since the previous run
+of the page (its ``snapshot``), for the debug view.
+"""
+
+import hashlib
+import time
+import types
+
+from viability import cache
+
+INPUT, CACHED, RECOMPUTED, SKIPPED = 'input', 'cached', 'recomputed', 'not needed'
+_MISSING = object()
+
+
+def digest(*parts):
+    """Short stable hex digest of ``parts``, frozen as for ``cache.result_key``."""
+    return hashlib.blake2b(repr(cache.result_key(*parts)).encode(), digest_size=12).hexdigest()
+
+
+def _code_parts(code):
+    consts = tuple(_code_parts(c) if isinstance(c, types.CodeType) else c for c in code.co_consts)
+    return code.co_code, consts, code.co_names, code.co_freevars
+
+
+def stage_id(compute):
+    """What ``compute`` runs: its bytecode, constants and the names it uses, not where it is defined.
+
+    Values it closes over are not part of it; they belong in ``params``.
+    Classes and builtins are identified by their qualified name.
+    """
+    if compute is None:
+        return None
+    code = getattr(compute, '__code__', None)
+    if code is None:
+        return f'{getattr(compute, "__module__", None)}.{getattr(compute, "__qualname__", repr(compute))}'
+    return digest(_code_parts(code))
+
+
+class Node:
+    """One stage of a ``Graph``; ``value`` evaluates it, and whatever it needs, on first access."""
+
+    def __init__(self, graph, name, compute, inputs, params, store):
+        self.graph = graph
+        self.name = name
+        self.inputs = tuple(inputs)
+        self.params = digest(*params)
+        self.key = digest(name, stage_id(compute), self.params, [node.key for node in self.inputs])
+        self.store = store
+        self.status = SKIPPED
+        self.seconds = 0.0
+        self._compute = compute
+        self._value = _MISSING
+
+    @property
+    def value(self):
+        if self._value is _MISSING:
+            self._value = self._evaluate()
+        return self._value
+
+    def _evaluate(self):
+        slot = ('stage', self.name, self.key)
+        if self.store is not None:
+            value = self.store.get(slot, _MISSING)
+        else:
+            # Unstored stages (cheap views) are carried over from the previous run only.
+            value = self.graph.carried(self)
+        if value is not _MISSING:
+            self.status = CACHED
+            return value
+
+        args = [node.value for node in self.inputs]
+        start = time.perf_counter()
+        value = self._compute(*args)
+        self.seconds = time.perf_counter() - start
+        self.status = RECOMPUTED
+        if self.store is not None:
+            self.store.put(slot, value)
+        return value
+
+
+class Graph:
+    """The stages of one run of ``page``, compared against the ``previous`` run's snapshot."""
+
+    def __init__(self, page, previous=None):
+        self.page = page
+        self.nodes = {}
+        self._previous = previous or {}
+
+    def source(self, name, key, value):
+        """Node for a value computed outside the graph, identified by ``key`` (e.g. the dataset hash)."""
+        node = self._add(Node(self, name, None, (), (key,), None))
+        node._value = value
+        node.status = INPUT
+        return node
+
+    def node(self, name, compute, *inputs, params=(), store=cache.results):
+        """Stage ``name`` computing ``compute(*values of inputs)``.
+
+        ``params`` must hold everything else the result depends on.
+        ``store`` is the cache the value is kept in across runs, pages and
+        sessions; ``None`` keeps it only until the next run of this page,
+        for values that are cheap to rebuild or not worth their bytes.
+        """
+        return self._add(Node(self, name, compute, inputs, params, store))
+
+    def _add(self, node):
+        if node.name in self.nodes:
+            raise ValueError(f'Stage {node.name!r} is already in the graph.')
+        self.nodes[node.name] = node
+        return node
+
+    def carried(self, node):
+        before = self._previous.get(node.name)
+        if before is None or before['key'] != node.key:
+            return _MISSING
+        return before.get('value', _MISSING)
+
+    def changes(self, node):
+        """What changed for ``node`` since the previous run: its parameters and the inputs whose keys moved."""
+        before = self._previous.get(node.name)
+        if before is None:
+            return ['new stage']
+        if before['key'] == node.key:
+            return []
+        changed = ['parameters'] if before['params'] != node.params else []
+        return changed + [n.name for n in node.inputs if before['inputs'].get(n.name) != n.key]
+
+    def snapshot(self):
+        """Keys of this run's stages (and values of its evaluated unstored ones) for the next run."""
+        snapshot = {}
+        for name, node in self.nodes.items():
+            entry = {'key': node.key, 'params': node.params, 'inputs': {n.name: n.key for n in node.inputs}}
+            if node.store is None and node._compute is not None:
+                value = node._value if node._value is not _MISSING else self.carried(node)
+                if value is not _MISSING:
+                    entry['value'] = value
+            snapshot[name] = entry
+        return snapshot
+
+    def report(self):
+        """One row per stage, in the order they were declared.
+
+        A stage recomputed although nothing changed was not in its cache
+        (never needed before, or evicted).
+        """
+        rows = []
+        for node in self.nodes.values():
+            changed = self.changes(node)
+            if not changed and node.status == RECOMPUTED:
+                changed = ['not cached']
+            rows.append({'stage': node.name, 'inputs': [n.name for n in node.inputs], 'status': node.status,
+                         'changed': changed, 'seconds': node.seconds})
+        return rows
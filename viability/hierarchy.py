@@ -0,0 +1,213 @@
+"""Precomputed state -> county -> plant index for the cascading filters.
+
+The dataset is reordered once so that every state, and every county within
+a state, is a contiguous block of rows. Option lists are then read from
+precomputed arrays and filtered views are ``iloc`` slices, instead of
+``unique()`` plus a boolean mask over the whole frame on every rerun.
+"""
+
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+ALL = 'All'
+LEVELS = ('PSTATABB', 'Plant county name', 'PNAME')
+
+
+def _is_all(value):
+    return value is None or (isinstance(value, str) and value == ALL)
+
+
+def _boundaries(codes):
+    """Start offsets of runs of equal values in a sorted code array, plus the end."""
+    starts = np.flatnonzero(np.diff(codes)) + 1
+    return np.concatenate([[0], starts, [codes.size]])
+
+
+def group_order(df, levels=LEVELS):
+    """Row order grouping ``df`` by state, then county, by first appearance.
+
+    Within a state, counties keep the order in which they first appear, and
+    rows keep their order within a county.
+    """
+    state_codes, _ = pd.factorize(df[levels[0]])
+    county_codes, counties = pd.factorize(df[levels[1]])
+    pair_codes, _ = pd.factorize(state_codes.astype(np.int64) * (len(counties) + 1) + county_codes)
+    return np.lexsort((pair_codes, state_codes))
+
+
+def sheet_positions(df):
+    """Position of each row of ``df`` in the uploaded sheet.
+
+    Compacted uploads keep the sheet row of every plant as their index, so a
+    unique integer index is taken as the sheet order; any other index means
+    the frame is still in sheet order.
+    """
+    index = df.index
+    if pd.api.types.is_integer_dtype(index.dtype) and index.is_unique:
+        return index.to_numpy(dtype=np.int64)
+    return np.arange(len(df), dtype=np.int64)
+
+
+def sheet_order(positions):
+    """Rows in sheet order; a scatter instead of a sort when positions are 0..n-1."""
+    if positions.size and positions.min() == 0 and positions.max() == positions.size - 1:
+        order = np.empty_like(positions)
+        order[positions] = np.arange(positions.size)
+        return order
+    return np.argsort(positions, kind='stable')
+
+
+def _code_order(codes):
+    """Stable order of factorized ``codes`` (-1 first), a radix sort while they are small."""
+    shifted = codes + 1
+    return np.argsort(shifted.astype(np.min_scalar_type(shifted.max(initial=0))), kind='stable')
+
+
+def _names_by_group(groups, items, names):
+    """Distinct ``names`` of each group's items, by first appearance in the rows.
+
+    ``groups`` and ``items`` are codes per row (-1 for missing); returns
+    ``{group code: object array of names}``.
+    """
+    keep = (groups >= 0) & (items >= 0)
+    span = len(names) + 1
+    # Distinct (group, item) pairs by first appearance, then gathered by group.
+    groups, items = np.divmod(pd.unique(groups[keep] * span + items[keep]), span)
+    order = _code_order(groups)
+    groups, items = groups[order], names[items[order]]
+    bounds = _boundaries(groups).tolist()
+    return {groups[start]: items[start:stop] for start, stop in zip(bounds[:-1], bounds[1:]) if start < stop}
+
+
+class HierarchyIndex:
+    """State/county/plant lookup over ``df`` grouped by state and county.
+
+    Option lists come out in order of first appearance in the sheet, as
+    ``unique()`` returned them.
+    """
+
+    def __init__(self, df, levels=LEVELS):
+        self.levels = state_col, county_col, plant_col = levels
+        # Codes are taken over the rows in sheet order, so they number values
+        # by first appearance and every option list can follow the sheet.
+        in_sheet = sheet_order(sheet_positions(df))
+        state_codes, states = pd.factorize(df[state_col].take(in_sheet))
+        county_codes, counties = pd.factorize(df[county_col].take(in_sheet))
+        plant_codes, plants = pd.factorize(df[plant_col].take(in_sheet))
+        pair_codes, _ = pd.factorize(state_codes.astype(np.int64) * (len(counties) + 1) + county_codes)
+        state_names, county_names = states.tolist(), counties.tolist()
+
+        # Plant options for every selection, built once rather than on each rerun.
+        self._all_plants = np.asarray(plants, dtype=object)
+        self._state_plants = {state_names[code]: names for code, names
+                              in _names_by_group(state_codes, plant_codes, self._all_plants).items()}
+        self._county_plants = {county_names[code]: names for code, names
+                               in _names_by_group(county_codes, plant_codes, self._all_plants).items()}
+        named_pairs = np.where((state_codes >= 0) & (county_codes >= 0), pair_codes, -1)
+        pair_plants = _names_by_group(named_pairs, plant_codes, self._all_plants)
+
+        # Group by state, then county; both sorts are stable, so rows keep sheet order.
+        order = _code_order(pair_codes)
+        order = order[_code_order(state_codes[order])]
+        rows = in_sheet[order]
+        # Compacted uploads are already grouped; only reorder (and copy) when needed.
+        self.frame = df.take(rows) if (np.diff(rows) < 0).any() else df
+        frame_rows = np.empty_like(order)
+        frame_rows[order] = np.arange(order.size)
+
+        # State blocks (rows with a missing state sort first and carry code -1).
+        sorted_states, sorted_counties, sorted_pairs = state_codes[order], county_codes[order], pair_codes[order]
+        state_bounds = _boundaries(sorted_states)
+        self._state_slices = {}
+        for start, stop in zip(state_bounds[:-1], state_bounds[1:]):
+            if sorted_states[start] >= 0:
+                self._state_slices[state_names[sorted_states[start]]] = slice(start, stop)
+        self._states = list(self._state_slices)
+
+        # County blocks inside each state, in first appearance within the state.
+        pair_bounds = _boundaries(sorted_pairs)
+        self._county_slices = {}
+        self._state_counties = {state: [] for state in self._states}
+        self._pair_plants = {}
+        for start, stop in zip(pair_bounds[:-1].tolist(), pair_bounds[1:].tolist()):
+            s, c = sorted_states[start], sorted_counties[start]
+            if s >= 0 and c >= 0:
+                state, county = state_names[s], county_names[c]
+                self._county_slices[state, county] = slice(start, stop)
+                self._state_counties[state].append(county)
+                self._pair_plants[state, county] = pair_plants.get(sorted_pairs[start], self._all_plants[:0])
+
+        # Counties across all states ("All" states) need their row positions
+        # gathered, kept in sheet order.
+        self._counties = county_names
+        county_order = _code_order(county_codes)
+        county_bounds = _boundaries(county_codes[county_order])
+        self._county_rows = {}
+        for start, stop in zip(county_bounds[:-1], county_bounds[1:]):
+            c = county_codes[county_order[start]]
+            if c >= 0:
+                self._county_rows[county_names[c]] = frame_rows[county_order[start:stop]]
+
+        self._plant_column = self.frame.columns.get_loc(plant_col)
+        self._plants = self.frame[plant_col].to_numpy()
+
+    def states(self):
+        return list(self._states)
+
+    def counties(self, state=ALL):
+        if _is_all(state):
+            return list(self._counties)
+        return list(self._state_counties.get(state, []))
+
+    def plants(self, state=ALL, county=ALL):
+        # Plant options follow first appearance in the uploaded sheet.
+        if _is_all(state) and _is_all(county):
+            names = self._all_plants
+        elif _is_all(county):
+            names = self._state_plants.get(state, self._all_plants[:0])
+        elif _is_all(state):
+            names = self._county_plants.get(county, self._all_plants[:0])
+        else:
+            names = self._pair_plants.get((state, county), self._all_plants[:0])
+        return names.tolist()
+
+    def _rows(self, state, county):
+        if _is_all(state) and _is_all(county):
+            return slice(None)
+        if _is_all(county):
+            return self._state_slices.get(state, slice(0, 0))
+        if _is_all(state):
+            return self._county_rows.get(county, np.empty(0, dtype=np.int64))
+        return self._county_slices.get((state, county), slice(0, 0))
+
+    def select(self, state=ALL, county=ALL, plant=ALL):
+        """Rows matching the selection; ``ALL`` (or ``None``) leaves a level unfiltered.
+
+        Rows come grouped by county rather than in upload order.
+        """
+        view = self.frame.iloc[self._rows(state, county)]
+        if _is_all(plant):
+            return view
+        # Counties hold a handful of plants, so a mask over the block is cheap.
+        return view[view.iloc[:, self._plant_column].to_numpy() == plant]
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def hierarchy_index(df, levels=LEVELS):
+    """Index for ``df``, built once and reused while the frame is alive."""
+    key = (id(df), tuple(levels))
+    with _lock:
+        entry = _indexes.get(key)
+        if entry is not None and entry[0]() is df:
+            return entry[1]
+    index = HierarchyIndex(df, levels)
+    with _lock:
+        _indexes[key] = (weakref.ref(df), index)
+        weakref.finalize(df, _indexes.pop, key, None)
+    return index
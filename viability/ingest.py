@@ -0,0 +1,392 @@
+"""Hash-keyed dataset ingest shared by every page.
+
+Uploaded workbooks are identified by a hash of their bytes. The first
+time a file is seen it is parsed with ``pd.read_excel`` and registered as a
+memory-mapped Arrow file (see ``viability.registry``) that every session
+shares. Frames Arrow cannot hold fall back to a Parquet copy in a local
+cache directory and an in-memory LRU. Either way, re-uploading the same
+file (or moving to another page) never parses the workbook again.
+
+Workbooks are streamed row by row through openpyxl's read-only mode,
+restricted to the columns asked for; CSV and Parquet uploads are read in
+chunks too. ``load_async`` runs the parse in a background thread so the
+page can show progress instead of freezing.
+"""
+
+import hashlib
+import io
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from viability import registry
+from viability.cache import ByteLRU
+from viability.hierarchy import LEVELS, group_order
+
+CACHE_DIR = Path(os.environ.get('VIABILITY_CACHE_DIR', Path.home() / '.cache' / 'h2project'))
+MEMORY_BUDGET = int(os.environ.get('VIABILITY_MEMORY_MB', 1024)) * 2**20
+DISK_BUDGET = int(os.environ.get('VIABILITY_DISK_MB', 4096)) * 2**20
+
+IDENTIFIER_COLUMNS = list(LEVELS)
+CHUNK_ROWS = 100_000
+UPLOAD_TYPES = ('xlsx', 'xlsm', 'csv', 'parquet')
+# Smaller chunks in the background so the progress bar moves on mid-sized files.
+PROGRESS_ROWS = 10_000
+LOAD_WORKERS = 2
+
+_datasets = ByteLRU(MEMORY_BUDGET)
+_reports = {}
+_headers = {}
+_jobs = {}
+_jobs_lock = threading.Lock()
+_loader = None
+
+
+def file_digest(data):
+    """Content hash of uploaded bytes; pass it on as ``digest`` so they are hashed only once."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def dataset_key(data, sheet=None, columns=None, digest=None):
+    """Content hash used to identify an uploaded file (and the part of it loaded).
+
+    ``digest`` is ``file_digest(data)`` when the caller already has it.
+    """
+    digest = digest or file_digest(data)
+    if sheet is None and columns is None:
+        return digest
+    part = repr((sheet, None if columns is None else sorted(map(str, columns))))
+    return hashlib.blake2b((digest + part).encode(), digest_size=16).hexdigest()
+
+
+def _parquet_path(key):
+    return CACHE_DIR / f'{key}.parquet'
+
+
+def _write_parquet(df, path):
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    try:
+        df.to_parquet(tmp)
+    except (ImportError, ValueError, TypeError):
+        # Mixed-type object columns (common in hand-edited sheets) cannot be
+        # written as Parquet; the in-memory copy still serves later reruns.
+        tmp.unlink(missing_ok=True)
+        return
+    os.replace(tmp, path)
+    _prune_disk()
+
+
+def _prune_disk():
+    files = sorted(CACHE_DIR.glob('*.parquet'), key=lambda p: p.stat().st_atime)
+    total = sum(p.stat().st_size for p in files)
+    while files and total > DISK_BUDGET:
+        oldest = files.pop(0)
+        total -= oldest.stat().st_size
+        oldest.unlink(missing_ok=True)
+
+
+def load_key(key):
+    """Return the cached DataFrame for ``key`` or ``None`` if it is unknown."""
+    df = _datasets.get(key)
+    if df is not None:
+        return df
+    try:
+        df = registry.open_dataset(key)
+    except (ImportError, OSError, ValueError):
+        df = None
+    if df is not None:
+        return df
+    path = _parquet_path(key)
+    if path.exists():
+        df = pd.read_parquet(path)
+        os.utime(path)
+        return _datasets.put(key, df)
+    return None
+
+
+def _downcast(column):
+    if pd.api.types.is_bool_dtype(column):
+        return column
+    if pd.api.types.is_integer_dtype(column):
+        return pd.to_numeric(column, downcast='integer')
+    values = column.to_numpy(dtype=np.float64)
+    if (values.size and not np.isnan(values).any() and np.abs(values).max() < 2**53
+            and np.array_equal(values, np.round(values))):
+        return pd.to_numeric(column.astype(np.int64), downcast='integer')
+    # float32 only when every value survives the round trip unchanged.
+    as32 = values.astype(np.float32)
+    if np.array_equal(as32.astype(np.float64), values, equal_nan=True):
+        return column.astype(np.float32)
+    return column
+
+
+def compact(df, identifiers=IDENTIFIER_COLUMNS):
+    """Smaller in-memory copy of an uploaded sheet, plus a memory report.
+
+    Identifier columns become categoricals, numeric columns are downcast to
+    the smallest type that holds every value exactly, and columns no page
+    can use (entirely empty, or text that is not an identifier) are
+    dropped. Rows are grouped by state and county, keeping their order
+    within a county, so the filter index can slice the frame without
+    reordering (and copying) it; the index keeps each row's position in the
+    sheet, so option lists can still follow the sheet's order.
+    """
+    before = df.memory_usage(deep=True)
+    dropped = [c for c in df.columns
+               if df[c].isna().all() or (c not in identifiers and not pd.api.types.is_numeric_dtype(df[c]))]
+    columns = {}
+    for name in df.columns:
+        if name in dropped:
+            continue
+        column = df[name]
+        columns[name] = column.astype('category') if name in identifiers else _downcast(column)
+    out = pd.DataFrame(columns, index=df.index)
+
+    if all(c in out.columns for c in identifiers[:2]):
+        order = group_order(out, identifiers)
+        if (np.diff(order) < 0).any():
+            out = out.take(order)
+
+    after = out.memory_usage(deep=True)
+    report = {
+        'before_bytes': int(before.sum()),
+        'after_bytes': int(after.sum()),
+        'dropped': list(map(str, dropped)),
+        'dtypes': {str(c): (str(df[c].dtype), str(out[c].dtype)) for c in out.columns},
+    }
+    return out, report
+
+
+def _store(key, df, name):
+    """Compact a freshly parsed frame and keep it in the registry (or the fallback caches)."""
+    df, _reports[key] = compact(df)
+    try:
+        return registry.register(key, df, name)
+    except (ImportError, ValueError, TypeError):
+        _write_parquet(df, _parquet_path(key))
+        return _datasets.put(key, df)
+
+
+def memory_report(key):
+    """Before/after bytes of the compaction, if this process parsed the file."""
+    return _reports.get(key)
+
+
+def file_kind(name):
+    """``'xlsx'``, ``'csv'`` or ``'parquet'`` from a file name."""
+    suffix = Path(name).suffix.lower().lstrip('.')
+    if suffix in ('xlsx', 'xlsm'):
+        return 'xlsx'
+    if suffix in ('csv', 'parquet'):
+        return suffix
+    raise ValueError(f'Unsupported file type: {Path(name).suffix}')
+
+
+def _open_workbook(source):
+    from openpyxl import load_workbook
+
+    # Read-only mode streams rows from the sheet XML instead of building the
+    # whole workbook in memory.
+    return load_workbook(source, read_only=True, data_only=True)
+
+
+def sheet_names(data, digest=None):
+    """Worksheet names of uploaded Excel bytes, without reading any rows."""
+    key = (digest or file_digest(data), 'sheets')
+    names = _headers.get(key)
+    if names is None:
+        workbook = _open_workbook(io.BytesIO(data))
+        try:
+            names = _headers[key] = list(workbook.sheetnames)
+        finally:
+            workbook.close()
+    return names
+
+
+def read_header(data, kind, sheet=None, digest=None):
+    """Column names of uploaded bytes, read without parsing the rows.
+
+    Remembered per file and sheet (as are ``sheet_names``), since opening
+    a large workbook still costs a pass over its shared strings. ``digest``
+    is ``file_digest(data)`` when the caller already has it.
+    """
+    key = (digest or file_digest(data), kind, sheet)
+    header = _headers.get(key)
+    if header is None:
+        if kind == 'csv':
+            header = [str(c) for c in pd.read_csv(io.BytesIO(data), nrows=0).columns]
+        elif kind == 'parquet':
+            import pyarrow.parquet as pq
+
+            header = [c for c in pq.ParquetFile(io.BytesIO(data)).schema_arrow.names
+                      if not c.startswith('__index_level_')]
+        else:
+            workbook = _open_workbook(io.BytesIO(data))
+            try:
+                worksheet = workbook[sheet] if sheet is not None else workbook.worksheets[0]
+                header = [str(h) for h in next(worksheet.iter_rows(max_row=1, values_only=True), ())
+                          if h is not None]
+            finally:
+                workbook.close()
+        _headers[key] = header
+    return header
+
+
+def _excel_chunks(source, columns, chunksize, sheet=None, expected=None):
+    workbook = _open_workbook(source)
+    try:
+        worksheet = workbook[sheet] if sheet is not None else workbook.worksheets[0]
+        # The sheet's recorded dimensions; missing in some generated files.
+        if expected is not None and worksheet.max_row:
+            expected(worksheet.max_row - 1)
+        rows = worksheet.iter_rows(values_only=True)
+        header = [str(h) if h is not None else '' for h in next(rows, ())]
+        keep = [i for i, h in enumerate(header) if columns is None or h in columns]
+        names = [header[i] for i in keep]
+        batch = []
+        for row in rows:
+            batch.append([row[i] if i < len(row) else None for i in keep])
+            if len(batch) == chunksize:
+                yield pd.DataFrame(batch, columns=names)
+                batch = []
+        if batch or not names:
+            yield pd.DataFrame(batch, columns=names)
+    finally:
+        workbook.close()
+
+
+def _chunks(source, kind, columns=None, chunksize=CHUNK_ROWS, sheet=None, dtype=None, expected=None):
+    # ``expected``, if given, is called with the row count the file records
+    # (Parquet metadata, worksheet dimensions) once it is open.
+    if kind == 'csv':
+        yield from pd.read_csv(source, usecols=columns, chunksize=chunksize, dtype=dtype)
+    elif kind == 'parquet':
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(source)
+        if expected is not None:
+            expected(parquet.metadata.num_rows)
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif kind == 'xlsx':
+        yield from _excel_chunks(source, columns, chunksize, sheet, expected)
+    else:
+        raise ValueError(f'Unsupported file type: {kind}')
+
+
+def _concat(chunks, columns=None):
+    frames = list(chunks)
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    # Cells streamed from a workbook arrive as Python objects; let pandas
+    # settle on the same dtypes read_excel would give them.
+    return pd.concat(frames, ignore_index=True).infer_objects()
+
+
+def iter_chunks(path, columns=None, chunksize=CHUNK_ROWS, dtype=None):
+    """Yield a CSV, Parquet or Excel file as DataFrames of ``chunksize`` rows.
+
+    ``columns`` restricts the read to those columns where the format allows;
+    ``dtype`` is passed to ``read_csv`` (the other formats carry their types).
+    """
+    yield from _chunks(Path(path), file_kind(path), columns, chunksize, dtype=dtype)
+
+
+def parse(source, kind='xlsx', sheet=None, columns=None):
+    """Parse a whole upload (a path or file object) as the load job does, before compaction."""
+    return _concat(_chunks(source, kind, columns, CHUNK_ROWS, sheet), columns)
+
+
+def read_file(path, columns=None):
+    """Read a whole CSV, Parquet or Excel file (first sheet) into a DataFrame."""
+    path = Path(path)
+    kind = file_kind(path)
+    if kind == 'csv':
+        return pd.read_csv(path, usecols=columns)
+    if kind == 'parquet':
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_excel(path, usecols=columns)
+
+
+class LoadJob:
+    """A file being parsed in a background thread.
+
+    Shared by every session that asks for the same file, sheet and
+    columns; ``rows`` and ``total`` drive a progress bar while ``done`` is
+    false. Once done, ``error`` is set or the dataset can be fetched with
+    ``load_key(job.key)``.
+    """
+
+    def __init__(self, key, name):
+        self.key = key
+        self.name = name
+        self.rows = 0
+        self.total = None
+        self.stage = 'Queued'
+        self.error = None
+        self.done = False
+        self.started = time.perf_counter()
+        self.seconds = None
+
+    @property
+    def progress(self):
+        if self.done:
+            return 1.0
+        if not self.total:
+            return 0.0
+        return min(self.rows / self.total, 0.99)
+
+    def _expect(self, total):
+        self.total = total
+
+    def _run(self, data, kind, sheet, columns):
+        try:
+            self.stage = 'Reading'
+            if kind == 'csv':
+                self.total = max(data.count(b'\n') - 1, 0)
+            frames = []
+            # Workbooks and Parquet files report their row count once the reader has them open.
+            for chunk in _chunks(io.BytesIO(data), kind, columns, PROGRESS_ROWS, sheet, expected=self._expect):
+                frames.append(chunk)
+                self.rows += len(chunk)
+            self.stage = 'Compacting'
+            _store(self.key, _concat(frames, columns), self.name)
+        except Exception as exc:  # reported to whoever polls the job
+            self.error = exc
+        finally:
+            self.seconds = time.perf_counter() - self.started
+            self.stage = 'Failed' if self.error else 'Done'
+            self.done = True
+
+
+def load_async(data, name=None, sheet=None, columns=None, kind='xlsx', digest=None):
+    """Start parsing uploaded bytes in the background and return the ``LoadJob``.
+
+    ``kind`` is ``'xlsx'``, ``'csv'`` or ``'parquet'``; ``sheet`` picks an
+    Excel worksheet (the first by default) and ``columns`` restricts the
+    parse to those columns; ``digest`` is ``file_digest(data)`` if already
+    known. ``name`` is shown when other sessions pick the dataset from the
+    registry. A file that is already loaded, or already being loaded, is
+    not parsed again. The loaded frame is compacted (see ``compact``) and
+    shared between reruns and sessions; callers must not modify it in place.
+    """
+    global _loader
+    key = dataset_key(data, sheet, columns, digest)
+    with _jobs_lock:
+        job = _jobs.get(key)
+        if job is not None and not job.error and (not job.done or load_key(key) is not None):
+            return job
+        job = _jobs[key] = LoadJob(key, name)
+        if load_key(key) is not None:
+            job.stage, job.done, job.seconds = 'Done', True, 0.0
+            return job
+        if _loader is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _loader = ThreadPoolExecutor(max_workers=LOAD_WORKERS, thread_name_prefix='ingest')
+    _loader.submit(job._run, data, kind, sheet, columns)
+    return job
@@ -0,0 +1,112 @@
+"""Opt-in per-rerun stage timing and memory instrumentation.
+
+A page creates one ``Profile`` per script run and calls ``lap`` after each
+stage; a lap records the wall time and memory allocated since the previous
+lap, plus an optional row count. Profiling is off unless enabled
+explicitly (sidebar toggle) or through the ``VIABILITY_PROFILE`` environment
+variable. Records can be appended to a JSON-lines log
+(``VIABILITY_PROFILE_LOG``, default ``viability-profile.jsonl``).
+
+Allocations are measured with ``tracemalloc``, which is process-wide:
+while several sessions profile at once their allocations overlap. Tracing
+stays on until the last profile using it finishes.
+"""
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+from datetime import datetime, timezone
+
+ENV_VAR = 'VIABILITY_PROFILE'
+LOG_ENV_VAR = 'VIABILITY_PROFILE_LOG'
+DEFAULT_LOG = 'viability-profile.jsonl'
+
+# Profiles measuring memory, and whether tracing was started by them (and so
+# may be stopped once none is left) rather than by someone else.
+_tracers = 0
+_started_tracing = False
+_tracing_lock = threading.Lock()
+
+
+def env_enabled():
+    return os.environ.get(ENV_VAR, '').strip().lower() not in ('', '0', 'false', 'no')
+
+
+def env_logging():
+    return bool(os.environ.get(LOG_ENV_VAR))
+
+
+def log_path():
+    return os.environ.get(LOG_ENV_VAR, DEFAULT_LOG)
+
+
+def _hold_tracing():
+    global _tracers, _started_tracing
+    with _tracing_lock:
+        if _tracers == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        _tracers += 1
+
+
+def _release_tracing():
+    global _tracers, _started_tracing
+    with _tracing_lock:
+        _tracers -= 1
+        if _tracers == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+class Profile:
+
+    def __init__(self, page, enabled=None, memory=True):
+        self.page = page
+        self.enabled = env_enabled() if enabled is None else bool(enabled)
+        self.records = []
+        self.started = datetime.now(timezone.utc).isoformat()
+        self._memory = self.enabled and memory
+        self._tracing = None
+        if self._memory:
+            _hold_tracing()
+            # Released by finish() or, failing that, when the profile is collected.
+            self._tracing = weakref.finalize(self, _release_tracing)
+        self._start = self._last = time.perf_counter()
+        self._mem_start = self._memory_now()
+
+    def _memory_now(self):
+        if not self._memory:
+            return 0
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        return current
+
+    def lap(self, stage, rows=None):
+        """Record everything since the previous lap as ``stage``."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        record = {'stage': stage, 'seconds': now - self._last, 'rows': None if rows is None else int(rows)}
+        if self._memory:
+            current, peak = tracemalloc.get_traced_memory()
+            record['allocated_bytes'] = current - self._mem_start
+            record['peak_bytes'] = peak - self._mem_start
+        self.records.append(record)
+        self._last = time.perf_counter()
+        self._mem_start = self._memory_now()
+
+    def finish(self):
+        """Release memory tracing (stopped once no profile uses it) and return the total time."""
+        if self._tracing is not None:
+            self._tracing()
+            self._memory = False
+        return time.perf_counter() - self._start
+
+    def write_log(self, path=None):
+        entry = {'page': self.page, 'started': self.started,
+                 'total_seconds': sum(r['seconds'] for r in self.records), 'stages': self.records}
+        with open(path or log_path(), 'a', encoding='utf-8') as log:
+            log.write(json.dumps(entry) + '\n')
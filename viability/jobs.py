@@ -0,0 +1,115 @@
+"""Background jobs keyed by their inputs.
+
+Long computations (simulations with up to 10^8 draws) are submitted to a
+small thread pool instead of running inside a Streamlit script run. A job
+is identified by a key built from everything it depends on, so a rerun,
+another page or another session asking for the same thing gets the same
+job back, running or finished. Jobs report progress through a callback
+passed to the work function; the same callback raises ``Cancelled`` once
+cancellation is requested, so the work stops at its next chunk.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+JOB_WORKERS = int(os.environ.get('VIABILITY_JOB_WORKERS', 2))
+# Finished jobs kept for retrieval; the oldest are dropped beyond this.
+MAX_FINISHED = 128
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+
+_jobs = OrderedDict()
+_lock = threading.Lock()
+_executor = None
+
+
+class Cancelled(Exception):
+    """Raised inside a job's work function once the job is cancelled."""
+
+
+class Job:
+    def __init__(self, key, label):
+        self.key = key
+        self.label = label
+        self.state = QUEUED
+        self.completed = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.seconds = None
+        self._cancel = threading.Event()
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    @property
+    def progress(self):
+        if self.state == DONE:
+            return 1.0
+        if not self.total:
+            return 0.0
+        return min(self.completed / self.total, 1.0)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def report(self, completed, total=None):
+        """Progress callback handed to the work function."""
+        if self._cancel.is_set():
+            raise Cancelled()
+        self.completed = completed
+        if total is not None:
+            self.total = total
+
+    def _run(self, fn, args, kwargs):
+        start = time.perf_counter()
+        try:
+            if self._cancel.is_set():
+                raise Cancelled()
+            self.state = RUNNING
+            self.result = fn(*args, progress=self.report, **kwargs)
+            self.state = DONE
+        except Cancelled:
+            self.state = CANCELLED
+        except Exception as exc:  # reported to whoever looks the job up
+            self.error = exc
+            self.state = FAILED
+        finally:
+            self.seconds = time.perf_counter() - start
+            _prune()
+
+
+def _prune():
+    with _lock:
+        finished = [key for key, job in _jobs.items() if job.finished]
+        for key in finished[:max(0, len(finished) - MAX_FINISHED)]:
+            del _jobs[key]
+
+
+def submit(key, fn, *args, label=None, **kwargs):
+    """Run ``fn(*args, progress=..., **kwargs)`` in the background under ``key``.
+
+    Returns the existing job if one with this key is queued, running or
+    done; failed and cancelled jobs are started again.
+    """
+    global _executor
+    with _lock:
+        job = _jobs.get(key)
+        if job is not None and job.state not in (FAILED, CANCELLED):
+            return job
+        job = _jobs[key] = Job(key, label)
+        if _executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+    _executor.submit(job._run, fn, args, kwargs)
+    return job
+
+
+def get(key):
+    """The job submitted under ``key``, if it is still known."""
+    with _lock:
+        return _jobs.get(key)
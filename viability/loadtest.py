@@ -0,0 +1,80 @@
+"""Load test for the scoring service.
+
+Sends a mix of ``/score``, ``/topk`` and ``/montecarlo`` requests with a
+fixed number in flight and reports latency percentiles per endpoint::
+
+    python -m viability.server plants.xlsx &
+    python -m viability.loadtest --requests 2000 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+
+from viability.server import DEFAULT_PORT
+
+
+def _requests(health, rng, count, draws):
+    plants = health.get('sample_plants', [])
+    states = health.get('states', ['All'])
+    for i in range(count):
+        weights = rng.dirichlet(np.ones(5)).round(4).tolist()
+        kind = ('score', 'topk', 'montecarlo')[i % 3]
+        if kind == 'score':
+            body = {'plants': list(rng.choice(plants, size=min(10, len(plants)), replace=False)) if plants else [],
+                    'weights': weights}
+        elif kind == 'topk':
+            body = {'state': str(rng.choice(states)), 'k': 10, 'weights': weights}
+        else:
+            body = {'state': str(rng.choice(states)), 'draws': draws, 'seed': int(i), 'weights': weights}
+        yield kind, body
+
+
+async def run(url, count, concurrency, draws, seed=0):
+    client = AsyncHTTPClient(max_clients=concurrency)
+    health = json.loads((await client.fetch(f'{url}/health?detail=1')).body)
+    latencies = {}
+    errors = 0
+    queue = asyncio.Queue()
+    for item in _requests(health, np.random.default_rng(seed), count, draws):
+        queue.put_nowait(item)
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            kind, body = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                await client.fetch(f'{url}/{kind}', method='POST', body=json.dumps(body), request_timeout=300)
+            except HTTPClientError:
+                errors += 1
+                continue
+            latencies.setdefault(kind, []).append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m viability.loadtest', description='Load test the scoring service.')
+    parser.add_argument('--url', default=f'http://127.0.0.1:{DEFAULT_PORT}')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--draws', type=int, default=100_000, help='draws per Monte Carlo request')
+    args = parser.parse_args(argv)
+
+    latencies, errors, seconds = asyncio.run(run(args.url, args.requests, args.concurrency, args.draws))
+    done = sum(len(v) for v in latencies.values())
+    print(f'{done} requests in {seconds:.2f}s ({done / seconds:.0f} req/s), {errors} errors')
+    for kind, values in sorted(latencies.items()):
+        p50, p99 = np.percentile(np.array(values) * 1000, [50, 99])
+        print(f'{kind:>10}: n={len(values):<6} p50={p50:8.2f} ms  p99={p99:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
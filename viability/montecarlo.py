@@ -0,0 +1,353 @@
+"""Chunked Monte Carlo simulation of the weighted score.
+
+Each draw samples every criterion independently from the values present in
+the current filter (as the page has always done) and scores the draw, or,
+with ``joint=True``, resamples whole plants so the criteria of a plant stay
+together; a joint draw is then a single gather of precomputed row scores.
+Blank (NaN) cells are never drawn: a criterion is sampled from its non-blank
+values, and joint draws only pick plants with every criterion.
+Draws are generated in fixed-size chunks from a seeded
+``np.random.Generator``; only running moments, a histogram of Y and the
+viable count are kept between chunks, so memory does not grow with the
+number of draws and a given seed always reproduces the same result.
+``simulate_until`` instead draws until a confidence-interval tolerance is
+met, optionally from scrambled Sobol or Latin hypercube sequences.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+DEFAULT_SEED = 0
+CHUNK_SIZE = 1 << 20
+HISTOGRAM_BINS = 1 << 14
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Convergence-driven runs (simulate_until).
+SAMPLERS = ('sobol', 'lhs', 'random')
+REPLICATES = 16
+FIRST_BATCH = 1 << 10
+MAX_DRAWS = 1 << 26
+CONFIDENCE = 0.95
+
+NOISE_DISTRIBUTIONS = ('normal', 'uniform', 'triangular')
+# Upper bound on the plant-draws held in memory at once by one batch
+# (each holds a few float64 arrays of this many elements).
+PLANT_CHUNK_ELEMENTS = 1 << 21
+# Below this many plant-draws a process pool costs more than it saves.
+PARALLEL_MIN_WORK = 2_000_000
+
+_executor = None
+
+
+class SimulationResult(NamedTuple):
+    draws: int
+    mean: float
+    std: float
+    std_error: float
+    percentiles: dict
+    p_viable: float
+    threshold: float
+    seed: int
+
+
+class _Accumulator:
+    """Streaming mean/variance (Chan et al. merge), histogram and viable count."""
+
+    def __init__(self, low, high, threshold, bins=HISTOGRAM_BINS):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.viable = 0
+        self.threshold = threshold
+        self.low = low
+        # Guard against a degenerate range when every draw is identical.
+        self.width = (high - low) / bins if high > low else 1.0
+        self.histogram = np.zeros(bins, dtype=np.int64)
+
+    def add(self, y):
+        n = y.size
+        if n == 0:
+            return
+        mean = float(y.mean())
+        m2 = float(((y - mean) ** 2).sum())
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.viable += int(np.count_nonzero(y > self.threshold))
+        bins = ((y - self.low) / self.width).astype(np.int64)
+        np.clip(bins, 0, self.histogram.size - 1, out=bins)
+        self.histogram += np.bincount(bins, minlength=self.histogram.size)
+
+    def percentile(self, q):
+        # Linear interpolation inside the histogram bin holding the q-th draw;
+        # the error is bounded by one bin width.
+        target = q / 100.0 * self.count
+        cumulative = np.cumsum(self.histogram)
+        b = int(np.searchsorted(cumulative, target, side='left'))
+        b = min(b, self.histogram.size - 1)
+        before = cumulative[b - 1] if b else 0
+        inside = self.histogram[b]
+        fraction = (target - before) / inside if inside else 0.0
+        return self.low + (b + fraction) * self.width
+
+    def result(self, seed, percentiles=PERCENTILES):
+        std = float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else 0.0
+        return SimulationResult(
+            draws=self.count,
+            mean=self.mean,
+            std=std,
+            std_error=std / np.sqrt(self.count) if self.count else 0.0,
+            percentiles={q: self.percentile(q) for q in percentiles},
+            p_viable=self.viable / self.count if self.count else 0.0,
+            threshold=self.threshold,
+            seed=seed,
+        )
+
+
+def _weighted(X, weights, joint):
+    # One array of values per gather a draw sums, without blank cells.
+    if joint:
+        # A single array of plant scores, so a draw is a single gather.
+        y = X @ weights
+        columns = [y[~np.isnan(y)]]
+    else:
+        # Pre-weight the columns so a draw is a sum of K gathers, no matmul.
+        columns = [column[~np.isnan(column)] for column in (X * weights).T]
+    if not all(column.size for column in columns):
+        raise ValueError('No plant in the selection has every criterion.' if joint
+                         else 'A criterion has no values in the selection.')
+    return columns
+
+
+def _range(weighted):
+    return float(sum(column.min() for column in weighted)), float(sum(column.max() for column in weighted))
+
+
+def simulate(X, weights, draws, threshold, seed=DEFAULT_SEED, chunk_size=CHUNK_SIZE,
+             percentiles=PERCENTILES, progress=None, joint=False):
+    """Simulate ``draws`` scores by resampling each column of ``X``.
+
+    ``X`` is the plants x K criteria matrix of the current filter and
+    ``threshold`` the viability threshold Y must exceed. ``joint`` draws
+    whole rows instead of each column independently. ``progress``, if
+    given, is called as ``progress(done, draws)`` after every chunk.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    n = len(X)
+    if n == 0:
+        raise ValueError('Cannot simulate an empty selection.')
+
+    weighted = _weighted(X, weights, joint)
+    acc = _Accumulator(*_range(weighted), threshold)
+
+    rng = np.random.default_rng(seed)
+    remaining = int(draws)
+    while remaining > 0:
+        m = min(chunk_size, remaining)
+        y = np.zeros(m)
+        for column in weighted:
+            y += column[rng.integers(0, column.size, size=m)]
+        acc.add(y)
+        remaining -= m
+        if progress is not None:
+            progress(int(draws) - remaining, int(draws))
+    return acc.result(seed, percentiles)
+
+
+class ConvergenceResult(NamedTuple):
+    simulation: SimulationResult
+    converged: bool
+    seconds: float
+    sampler: str
+    mean_half_width: float
+    p_half_width: float
+    history: list
+
+
+def _engines(sampler, k, replicates, seed):
+    if sampler == 'random':
+        return [np.random.default_rng(seed)]
+    from scipy.stats import qmc
+
+    seeds = np.random.SeedSequence(seed).spawn(replicates)
+    if sampler == 'sobol':
+        return [qmc.Sobol(k, scramble=True, seed=np.random.default_rng(s)) for s in seeds]
+    if sampler == 'lhs':
+        return [qmc.LatinHypercube(k, seed=np.random.default_rng(s)) for s in seeds]
+    raise ValueError(f'Unknown sampler: {sampler!r}')
+
+
+def simulate_until(X, weights, threshold, tolerance=None, p_tolerance=None, sampler='sobol',
+                   confidence=CONFIDENCE, max_draws=MAX_DRAWS, seed=DEFAULT_SEED,
+                   replicates=REPLICATES, first_batch=FIRST_BATCH, chunk_size=CHUNK_SIZE,
+                   percentiles=PERCENTILES, progress=None, joint=False):
+    """Draw until the confidence intervals of mean Y and P(viable) are narrow enough.
+
+    ``tolerance`` bounds the half-width of the interval on mean Y (score
+    units) and ``p_tolerance`` the one on P(viable); ``None`` leaves that
+    estimate unconstrained. The draws double every round, up to
+    ``max_draws``.
+
+    ``sampler`` picks how the K column indices of a draw are generated:
+    ``'random'`` uses a seeded ``np.random.Generator`` and the usual
+    standard error; ``'sobol'`` (scrambled Sobol) and ``'lhs'`` (Latin
+    hypercube) use ``replicates`` independently randomized sequences and
+    take the standard error from the spread of their means, since draws
+    within one quasi-random sequence are not independent. ``joint`` draws
+    whole rows, as in ``simulate``.
+
+    ``progress``, if given, is called as ``progress(done, expected)`` after
+    every chunk, ``expected`` being the draws the latest half-widths
+    suggest are needed (capped at ``max_draws``).
+    """
+    from statistics import NormalDist
+    from time import perf_counter
+
+    X = np.asarray(X, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    n = len(X)
+    if n == 0:
+        raise ValueError('Cannot simulate an empty selection.')
+    if tolerance is None and p_tolerance is None:
+        raise ValueError('Set tolerance, p_tolerance or both.')
+
+    start = perf_counter()
+    weighted = _weighted(X, weights, joint)
+    d = len(weighted)
+    acc = _Accumulator(*_range(weighted), threshold)
+    engines = _engines(sampler, d, replicates, seed)
+    r = len(engines)
+    sums = np.zeros(r)
+    viable = np.zeros(r)
+    if r > 1:
+        from scipy.stats import t
+        critical = float(t.ppf(0.5 + confidence / 2, r - 1))
+    else:
+        critical = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    per_engine = 0
+    expected = int(max_draws)
+    history = []
+    while True:
+        # Doubling keeps each Sobol sequence at a power-of-two length.
+        m = max(first_batch, per_engine)
+        for e, engine in enumerate(engines):
+            remaining = m
+            while remaining > 0:
+                size = min(remaining, max(chunk_size // r, 1))
+                u = engine.random((size, d)) if sampler == 'random' else engine.random(size)
+                y = np.zeros(size)
+                for j, column in enumerate(weighted):
+                    y += column[np.minimum((u[:, j] * column.size).astype(np.int64), column.size - 1)]
+                acc.add(y)
+                sums[e] += y.sum()
+                viable[e] += np.count_nonzero(y > threshold)
+                remaining -= size
+                if progress is not None:
+                    progress(acc.count, expected)
+        per_engine += m
+
+        if r > 1:
+            means = sums / per_engine
+            shares = viable / per_engine
+            mean_se = float(means.std(ddof=1) / np.sqrt(r))
+            p_se = float(shares.std(ddof=1) / np.sqrt(r))
+        else:
+            p = acc.viable / acc.count
+            mean_se = float(np.sqrt(acc.m2 / (acc.count - 1) / acc.count))
+            p_se = float(np.sqrt(p * (1 - p) / acc.count))
+        mean_half, p_half = critical * mean_se, critical * p_se
+        history.append((acc.count, mean_half, p_half))
+
+        converged = ((tolerance is None or mean_half <= tolerance)
+                     and (p_tolerance is None or p_half <= p_tolerance))
+        if converged or acc.count + per_engine * r > max_draws:
+            break
+        # Half-widths shrink as 1/sqrt(draws) (faster for Sobol).
+        ratio = max((mean_half / tolerance) ** 2 if tolerance else 0.0,
+                    (p_half / p_tolerance) ** 2 if p_tolerance else 0.0)
+        expected = int(min(max_draws, max(acc.count * ratio, 2 * acc.count)))
+
+    simulation = acc.result(seed, percentiles)._replace(std_error=mean_se)
+    return ConvergenceResult(simulation, converged, perf_counter() - start, sampler,
+                             mean_half, p_half, history)
+
+
+def _noise(rng, distribution, scale, size):
+    if distribution == 'normal':
+        return rng.normal(0.0, scale, size)
+    if distribution == 'uniform':
+        return rng.uniform(-scale, scale, size)
+    if distribution == 'triangular':
+        return rng.triangular(-scale, 0.0, scale, size)
+    raise ValueError(f'Unknown noise distribution: {distribution!r}')
+
+
+def _plant_batch(X, weights, threshold, draws, distribution, scale, low, high, seed_seq):
+    rng = np.random.default_rng(seed_seq)
+    n = X.shape[0]
+    viable = np.zeros(n, dtype=np.int64)
+    step = max(1, PLANT_CHUNK_ELEMENTS // max(1, n))
+    # Draws are taken in chunks and only the viable counts kept.
+    for done in range(0, draws, step):
+        y = np.zeros((n, min(step, draws - done)))
+        for j in range(X.shape[1]):
+            if weights[j] == 0:
+                continue
+            perturbed = X[:, j, None] + _noise(rng, distribution, scale[j], y.shape)
+            np.clip(perturbed, low[j], high[j], out=perturbed)
+            y += weights[j] * perturbed
+        viable += np.count_nonzero(y > threshold, axis=1)
+    return viable / draws
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # Forking the multithreaded Streamlit server can copy held locks into
+        # the children; spawned workers start from a clean interpreter.
+        _executor = ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def plant_viability(X, weights, threshold, draws=1000, distribution='normal', scale=0.5,
+                    low=None, high=None, seed=DEFAULT_SEED, batch_size=None, parallel=None):
+    """Probability that each plant stays viable when its scores are perturbed.
+
+    Every criterion score of every plant receives ``draws`` independent noise
+    samples (``scale`` is in score units, scalar or one per criterion) and is
+    clipped to ``[low, high]`` (the column range of ``X`` by default). Plants
+    are processed in batches of ``batch_size`` (by default as many as fit
+    ``PLANT_CHUNK_ELEMENTS`` plant-draws), each with its own child
+    ``SeedSequence``, so the result depends only on ``seed``, ``draws`` and
+    ``batch_size``, not on how many processes evaluated the batches.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    n, k = X.shape
+    if n == 0:
+        return np.zeros(0)
+    scale = np.broadcast_to(np.asarray(scale, dtype=np.float64), (k,))
+    low = np.nanmin(X, axis=0) if low is None else np.asarray(low, dtype=np.float64)
+    high = np.nanmax(X, axis=0) if high is None else np.asarray(high, dtype=np.float64)
+    if batch_size is None:
+        batch_size = max(1, PLANT_CHUNK_ELEMENTS // max(1, int(draws)))
+
+    starts = range(0, n, batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    args = [(X[s:s + batch_size], weights, threshold, int(draws), distribution, scale, low, high, ss)
+            for s, ss in zip(starts, seeds)]
+
+    if parallel is None:
+        parallel = n * draws >= PARALLEL_MIN_WORK and len(args) > 1
+    if parallel:
+        parts = list(_pool().map(_plant_batch, *zip(*args)))
+    else:
+        parts = [_plant_batch(*a) for a in args]
+    return np.concatenate(parts)
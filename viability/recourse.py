@@ -0,0 +1,117 @@
+"""Smallest change that would make each non-viable plant viable.
+
+Two kinds of change are solved for every plant at once:
+
+* Score change: with the weights fixed, the smallest total increase in
+  criterion scores (each capped at the dataset maximum) that lifts Y to
+  the threshold. This linear program is a fractional knapsack, so raising
+  the highest-weighted criteria first is optimal and has a closed form.
+* Weight change: with the scores fixed, the weights closest (Euclidean)
+  to the chosen ones, keeping their total, under which the plant reaches
+  the threshold. Reaching it is the linear constraint
+  ``w @ (x - fraction * column_max) >= 0``, so the answer is the
+  projection of ``w + lam * a`` onto the simplex for the smallest
+  feasible ``lam``, found by a bisection run for all plants together.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+from viability.scoring import VIABILITY_FRACTION, as_weights
+
+BISECTION_STEPS = 32
+
+
+class MinimumChange(NamedTuple):
+    gap: np.ndarray
+    score_change: np.ndarray
+    score_total: np.ndarray
+    weights: np.ndarray
+    weight_shift: np.ndarray
+
+
+def project_simplex(V, total=1.0):
+    """Euclidean projection of each row of ``V`` onto ``{w >= 0, sum(w) = total}``."""
+    V = np.atleast_2d(np.asarray(V, dtype=np.float64))
+    U = -np.sort(-V, axis=1)
+    excess = np.cumsum(U, axis=1) - total
+    support = U - excess / np.arange(1, V.shape[1] + 1) > 0
+    last = V.shape[1] - 1 - np.argmax(support[:, ::-1], axis=1)
+    shift = excess[np.arange(len(V)), last] / (last + 1)
+    return np.maximum(V - shift[:, None], 0.0)
+
+
+def _score_change(X, w, column_max, gap):
+    # Raise criteria in order of decreasing weight, each up to its maximum.
+    order = np.argsort(-w, kind='stable')
+    w_sorted = w[order]
+    headroom = np.clip(column_max - X, 0.0, None)[:, order]
+    gain = headroom * w_sorted
+    before = np.cumsum(gain, axis=1) - gain
+    need = np.clip(gap[:, None] - before, 0.0, None)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        step = np.where(w_sorted > 0, np.minimum(need / w_sorted, headroom), 0.0)
+    change = np.empty_like(step)
+    change[:, order] = step
+    feasible = gain.sum(axis=1) >= gap
+    change[~feasible] = np.nan
+    return change
+
+
+def _weight_change(A, w):
+    n = len(A)
+    total = w.sum()
+    W = np.tile(w, (n, 1))
+    y = A @ w
+    # A blank (NaN) cell leaves nothing to reach, as in _score_change.
+    W[~np.isfinite(y)] = np.nan
+    pending = y < 0
+    # Unreachable unless some criterion is above its share of the threshold.
+    unreachable = pending & ~(A.max(axis=1) > 0)
+    W[unreachable] = np.nan
+    pending &= ~unreachable
+    if not pending.any() or total <= 0:
+        W[pending] = np.nan
+        return W
+
+    a = A[pending]
+
+    def meets(lam):
+        return np.einsum('ij,ij->i', project_simplex(w + lam[:, None] * a, total), a) >= 0
+
+    lo = np.zeros(len(a))
+    hi = np.ones(len(a))
+    for _ in range(64):
+        short = ~meets(hi)
+        if not short.any():
+            break
+        hi[short] *= 2.0
+    for _ in range(BISECTION_STEPS):
+        mid = (lo + hi) / 2
+        ok = meets(mid)
+        hi = np.where(ok, mid, hi)
+        lo = np.where(ok, lo, mid)
+    W[pending] = project_simplex(w + hi[:, None] * a, total)
+    return W
+
+
+def minimum_change(X, weights, column_max, fraction=VIABILITY_FRACTION):
+    """Smallest score and weight changes that bring each row of ``X`` to the threshold.
+
+    ``gap`` is how far each plant's Y is below the threshold (zero or
+    negative when already viable). ``score_change`` holds the per-criterion
+    increases and ``score_total`` their sum; ``weights`` holds the closest
+    weights with the same total and ``weight_shift`` the share of the total
+    weight that moves. Rows that cannot be made viable are ``nan``.
+    """
+    X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+    w = as_weights(weights)
+    column_max = np.asarray(column_max, dtype=np.float64)
+    A = X - fraction * column_max
+    gap = -(A @ w)
+
+    change = _score_change(X, w, column_max, gap)
+    W = _weight_change(A, w)
+    shift = np.abs(W - w).sum(axis=1) / 2 / w.sum() if w.sum() > 0 else np.full(len(X), np.nan)
+    return MinimumChange(gap, change, change.sum(axis=1), W, shift)
@@ -0,0 +1,167 @@
+"""Server-wide registry of datasets held as memory-mapped Arrow files.
+
+The first upload of a workbook is written once as an Arrow IPC file in a
+local directory. Every session (and every server process on the machine)
+then maps that file read-only instead of holding its own parsed copy, so
+the numeric columns live in the shared page cache rather than on each
+session's heap. Sessions hold a ``Lease`` on the dataset they use;
+datasets nobody holds are evicted, least recently used first, once the
+registry directory grows past its disk budget.
+"""
+
+import json
+import os
+import threading
+import time
+import weakref
+from pathlib import Path
+
+REGISTRY_DIR = Path(os.environ.get(
+    'VIABILITY_REGISTRY_DIR',
+    Path(os.environ.get('VIABILITY_CACHE_DIR', Path.home() / '.cache' / 'h2project')) / 'registry'))
+REGISTRY_BUDGET = int(os.environ.get('VIABILITY_REGISTRY_MB', 8192)) * 2**20
+
+# key -> mapped DataFrame, and key -> number of live leases in this process
+_frames = {}
+_refs = {}
+_lock = threading.RLock()
+
+
+def _arrow_path(key):
+    return REGISTRY_DIR / f'{key}.arrow'
+
+
+def _meta_path(key):
+    return REGISTRY_DIR / f'{key}.json'
+
+
+def register(key, df, name=None):
+    """Store ``df`` under ``key`` (once) and return the memory-mapped copy.
+
+    Raises ``ImportError`` without pyarrow, and ``ValueError`` or
+    ``TypeError`` for columns Arrow cannot represent.
+    """
+    import pyarrow as pa
+
+    with _lock:
+        path = _arrow_path(key)
+        if not path.exists():
+            REGISTRY_DIR.mkdir(parents=True, exist_ok=True)
+            table = pa.Table.from_pandas(df, preserve_index=True)
+            tmp = path.with_suffix('.tmp')
+            with pa.OSFile(str(tmp), 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp, path)
+            meta = {'key': key, 'name': name or key, 'rows': len(df), 'columns': len(df.columns),
+                    'registered': time.time()}
+            _meta_path(key).write_text(json.dumps(meta))
+        frame = open_dataset(key)
+    evict()
+    return frame
+
+
+def open_dataset(key):
+    """Memory-mapped DataFrame for ``key``, or ``None`` if it is not registered.
+
+    Numeric columns without missing values point straight into the mapped
+    file; the frame is read-only and shared, so callers must not modify it.
+    """
+    import pyarrow as pa
+
+    with _lock:
+        frame = _frames.get(key)
+        path = _arrow_path(key)
+        if frame is None:
+            if not path.exists():
+                return None
+            source = pa.memory_map(str(path), 'r')
+            table = pa.ipc.open_file(source).read_all()
+            frame = _frames[key] = table.to_pandas(split_blocks=True)
+        _touch(path)
+        return frame
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def is_registered(key):
+    return key is not None and _arrow_path(key).exists()
+
+
+class Lease:
+    """A session's hold on a registered dataset.
+
+    Released by ``release()`` or, failing that, when the lease is garbage
+    collected together with the session that owns it.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        with _lock:
+            _refs[key] = _refs.get(key, 0) + 1
+        self._finalizer = weakref.finalize(self, _release, key)
+
+    def release(self):
+        self._finalizer()
+
+
+def _release(key):
+    with _lock:
+        remaining = _refs.get(key, 0) - 1
+        if remaining > 0:
+            _refs[key] = remaining
+        else:
+            _refs.pop(key, None)
+        _touch(_arrow_path(key))
+    evict()
+
+
+def evict(max_bytes=REGISTRY_BUDGET):
+    """Delete unused datasets, least recently used first, until under ``max_bytes``.
+
+    Only datasets without a lease in this process are candidates. A file
+    still mapped by another process stays readable there until it is
+    unmapped.
+    """
+    with _lock:
+        if not REGISTRY_DIR.exists():
+            return []
+        files = sorted(REGISTRY_DIR.glob('*.arrow'), key=lambda p: p.stat().st_atime)
+        total = sum(p.stat().st_size for p in files)
+        evicted = []
+        for path in files:
+            if total <= max_bytes:
+                break
+            key = path.stem
+            if _refs.get(key):
+                continue
+            total -= path.stat().st_size
+            _frames.pop(key, None)
+            for stale in (path, _meta_path(key)):
+                try:
+                    stale.unlink(missing_ok=True)
+                except OSError:
+                    pass
+            evicted.append(key)
+        return evicted
+
+
+def datasets():
+    """Registered datasets, most recently used first, with their size and users."""
+    if not REGISTRY_DIR.exists():
+        return []
+    listing = []
+    with _lock:
+        for path in REGISTRY_DIR.glob('*.arrow'):
+            try:
+                meta = json.loads(_meta_path(path.stem).read_text())
+                stat = path.stat()
+            except (OSError, ValueError):
+                continue
+            meta.update(bytes=stat.st_size, last_used=stat.st_atime, sessions=_refs.get(path.stem, 0))
+            listing.append(meta)
+    return sorted(listing, key=lambda d: d['last_used'], reverse=True)
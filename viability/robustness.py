@@ -0,0 +1,113 @@
+"""How stable the ranking is when the weights move.
+
+Weight vectors are sampled around the chosen weights (Dirichlet) or laid
+out on a regular grid over the whole weight simplex. All plants are scored
+for all weight vectors with one ``(S x K) @ (K x plants)`` product per
+chunk of samples, so each sample's scores are contiguous. Top-k
+membership is found with ``argpartition``, and ranks are read off each
+sample's sorted scores with ``searchsorted``.
+"""
+
+from itertools import combinations
+from math import comb
+from typing import NamedTuple
+
+import numpy as np
+
+from viability.montecarlo import DEFAULT_SEED
+
+CONCENTRATION = 200.0
+WEIGHT_SAMPLES = 2000
+MAX_GRID_POINTS = 100_000
+# Upper bound on the floats held by one chunk of scores / rank comparisons.
+CHUNK_ELEMENTS = 1 << 24
+
+
+class Robustness(NamedTuple):
+    top_k_frequency: np.ndarray
+    rank_quantiles: np.ndarray
+    samples: int
+
+
+def dirichlet_weights(weights, samples=WEIGHT_SAMPLES, concentration=CONCENTRATION, seed=DEFAULT_SEED):
+    """``K x S`` weight vectors drawn from a Dirichlet centred on ``weights``.
+
+    Larger ``concentration`` keeps the samples closer to ``weights``;
+    criteria with zero weight stay at zero.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    total = weights.sum()
+    if total <= 0:
+        raise ValueError('At least one weight must be positive.')
+    active = weights > 0
+    rng = np.random.default_rng(seed)
+    W = np.zeros((weights.size, int(samples)))
+    W[active] = rng.dirichlet(concentration * weights[active] / total, int(samples)).T
+    return W
+
+
+def grid_size(k, steps):
+    """Number of weight vectors ``simplex_grid(k, steps)`` lays out."""
+    return comb(steps + k - 1, k - 1)
+
+
+def simplex_grid(k, steps):
+    """Every weight vector on the simplex with components in multiples of ``1/steps``.
+
+    Refuses grids of more than ``MAX_GRID_POINTS`` vectors, which grow as
+    ``C(steps + k - 1, k - 1)``.
+    """
+    size = grid_size(k, steps)
+    if size > MAX_GRID_POINTS:
+        raise ValueError(f'A grid of {steps} steps over {k} weights has {size:,} points, more than '
+                         f'{MAX_GRID_POINTS:,}; use fewer steps or sample around the chosen weights.')
+    # Stars and bars: choosing k - 1 bar positions among steps + k - 1 slots.
+    bars = np.array(list(combinations(range(steps + k - 1), k - 1)), dtype=np.int64).reshape(-1, k - 1)
+    edges = np.column_stack([np.full(len(bars), -1), bars, np.full(len(bars), steps + k - 1)])
+    return (np.diff(edges, axis=1) - 1).T / steps
+
+
+def _scores(X, W):
+    # Samples along the first axis so each sample's scores are contiguous.
+    XT = np.ascontiguousarray(X.T)
+    step = max(1, CHUNK_ELEMENTS // max(1, len(X)))
+    for start in range(0, W.shape[1], step):
+        yield W[:, start:start + step].T @ XT
+
+
+def rank_robustness(X, W, k, rows=None, quantiles=(0.05, 0.5, 0.95)):
+    """Top-k membership frequency and rank quantiles over weight samples.
+
+    ``X`` is plants x K, ``W`` is K x S. The frequency is returned for every
+    plant; rank quantiles (1 = best) are computed for ``rows`` only, by
+    default the plants that entered the top k at least once, and are NaN
+    for the others.
+    """
+    X = np.asarray(X, dtype=np.float32)
+    W = np.asarray(W, dtype=np.float32)
+    n, samples = len(X), W.shape[1]
+    k = min(int(k), n)
+    counts = np.zeros(n, dtype=np.int64)
+    if n == 0 or k == 0:
+        return Robustness(counts.astype(float), np.full((n, len(quantiles)), np.nan), samples)
+
+    for Y in _scores(X, W):
+        top = np.argpartition(-Y, k - 1, axis=1)[:, :k]
+        counts += np.bincount(top.ravel(), minlength=n)
+
+    rows = np.flatnonzero(counts) if rows is None else np.asarray(rows, dtype=np.int64)
+    ranks = np.empty((rows.size, samples), dtype=np.int64)
+    offset = 0
+    for Y in _scores(X, W):
+        # Rank = 1 + number of strictly higher scores, read off each sample's
+        # sorted scores (NaN sorts last and, as in a comparison, never counts).
+        ordered = np.sort(Y, axis=1)
+        scored = n - np.isnan(Y).sum(axis=1)
+        for j in range(len(Y)):
+            ranks[:, offset + j] = 1 + scored[j] - np.searchsorted(ordered[j], Y[j, rows], side='right')
+        offset += len(Y)
+
+    rank_quantiles = np.full((n, len(quantiles)), np.nan)
+    if rows.size:
+        rank_quantiles[rows] = np.quantile(ranks, quantiles, axis=1).T
+    return Robustness(counts / samples, rank_quantiles, samples)
@@ -0,0 +1,190 @@
+"""Named policy scenarios scored together.
+
+A scenario is a name, a weight per criterion and the fraction of the
+maximum Y a plant must exceed to be viable. Scenarios are saved to a
+JSON file so every session sees them. All plants are scored under all
+scenarios with one float64 ``X @ W`` product per chunk of rows, and
+viability agrees exactly with ``scoring.evaluate``; only per-scenario
+summaries are kept, so memory does not grow with the number of plants.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+from viability.ingest import CACHE_DIR
+from viability.scoring import VIABILITY_FRACTION, weighted_sums
+
+SCENARIO_FILE = Path(os.environ.get('VIABILITY_SCENARIOS', CACHE_DIR / 'scenarios.json'))
+# Upper bound on the scores held by one chunk of rows.
+CHUNK_ELEMENTS = 1 << 22
+
+
+class Scenario(NamedTuple):
+    name: str
+    weights: dict
+    fraction: float = VIABILITY_FRACTION
+
+
+class ScenarioResults(NamedTuple):
+    names: list
+    thresholds: np.ndarray
+    viable: np.ndarray
+    viable_in: np.ndarray
+    both_viable: np.ndarray
+    top_rows: np.ndarray
+    top_scores: np.ndarray
+
+    @property
+    def flips(self):
+        """``S x S`` count of plants viable under the row scenario but not the column one."""
+        return self.viable[:, None] - self.both_viable
+
+    @property
+    def flipping(self):
+        """Rows whose viability differs between at least two scenarios."""
+        return np.flatnonzero((self.viable_in > 0) & (self.viable_in < len(self.names)))
+
+
+def load_scenarios(path=SCENARIO_FILE):
+    try:
+        entries = json.loads(Path(path).read_text())
+    except (OSError, ValueError):
+        return []
+    return [Scenario(e['name'], dict(e['weights']), float(e.get('fraction', VIABILITY_FRACTION)))
+            for e in entries]
+
+
+def save_scenarios(scenarios, path=SCENARIO_FILE):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps([s._asdict() for s in scenarios], indent=2))
+    os.replace(tmp, path)
+
+
+def put_scenario(scenario, path=SCENARIO_FILE):
+    """Save ``scenario``, replacing any saved scenario of the same name."""
+    scenarios = [s for s in load_scenarios(path) if s.name != scenario.name] + [scenario]
+    save_scenarios(scenarios, path)
+    return scenarios
+
+
+def delete_scenarios(names, path=SCENARIO_FILE):
+    scenarios = [s for s in load_scenarios(path) if s.name not in set(names)]
+    save_scenarios(scenarios, path)
+    return scenarios
+
+
+def weight_matrix(scenarios, criteria):
+    """``K x S`` weights of ``scenarios`` for ``criteria`` (0 where a scenario has none)."""
+    return np.array([[s.weights.get(c, 0.0) for s in scenarios] for c in criteria],
+                    dtype=np.float64).reshape(len(criteria), len(scenarios))
+
+
+def _scores(X, W, thresholds):
+    # S x plants scores from one BLAS product. Its summation order differs
+    # from ``scoring.score``'s, so scores within rounding distance of their
+    # threshold are summed again the way ``score`` sums them; only those can
+    # land on the other side, and whole-number criteria put many plants
+    # exactly on it.
+    Y = W.T @ X.T  # (X @ W).T, but written scenario-major without a transposing copy
+    bound = np.fmax.reduce(np.abs(X), axis=0, initial=0.0) @ np.abs(W)
+    slack = 2 * W.shape[0] * np.finfo(np.float64).eps * bound
+    scenario, row = np.nonzero(np.abs(Y - thresholds[:, None]) <= slack[:, None])
+    if scenario.size:
+        exact = np.zeros(scenario.size)
+        for i in range(W.shape[0]):
+            exact += X[row, i] * W[i, scenario]
+        Y[scenario, row] = exact
+    return Y
+
+
+def viable_matrix(X, W, thresholds):
+    """``plants x S`` viability of ``X`` under every scenario, as ``evaluate_scenarios`` decides it."""
+    X, W = np.asarray(X, dtype=np.float64), np.asarray(W, dtype=np.float64)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    return (_scores(X, W, thresholds) > thresholds[:, None]).T
+
+
+def _chunk_top(Y, m):
+    # Best m columns of every row of Y, ties at the cut-off going to the lowest column.
+    kth = -np.partition(-Y, m - 1, axis=1)[:, m - 1:m]
+    keep = Y >= kth
+    excess = np.flatnonzero(keep.sum(axis=1) > m)
+    if excess.size:
+        # Only rows with ties straddling the cut-off need the ordered count.
+        sub, cut = Y[excess], kth[excess]
+        tied = sub == cut
+        room = m - (sub > cut).sum(axis=1, keepdims=True)
+        keep[excess] = (sub > cut) | (tied & (np.cumsum(tied, axis=1, dtype=np.int32) <= room))
+    rows = np.nonzero(keep)[1].reshape(len(Y), m)
+    return rows, np.take_along_axis(Y, rows, axis=1)
+
+
+def evaluate_scenarios(X, W, fractions, column_max, k=10, names=None):
+    """Score every row of ``X`` under every column of ``W`` and summarise.
+
+    ``fractions`` holds each scenario's viability fraction and
+    ``column_max`` the dataset-wide criterion maxima the thresholds are
+    taken from. Returns per-scenario viable counts, the number of
+    scenarios each plant is viable in, the ``S x S`` matrix of plants
+    viable under both scenarios, and each scenario's top ``k`` rows (best
+    first, ties broken by row). Rows with a blank (NaN) criterion score
+    NaN under every scenario: they are never viable and never ranked, so
+    the top lists hold at most as many rows as have every criterion.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    W = np.asarray(W, dtype=np.float64)
+    n, s = len(X), W.shape[1]
+    thresholds = weighted_sums(np.asarray(column_max, dtype=np.float64), W) * np.asarray(fractions, dtype=np.float64)
+    complete = ~np.isnan(X).any(axis=1)
+    k = min(int(k), int(complete.sum()))
+
+    viable = np.zeros(s, dtype=np.int64)
+    viable_in = np.zeros(n, dtype=np.int32)
+    both = np.zeros((s, s), dtype=np.float64)
+    best_rows = np.zeros((s, 0), dtype=np.int64)
+    best_scores = np.zeros((s, 0), dtype=np.float64)
+
+    limits = thresholds[:, None]
+    step = max(1, CHUNK_ELEMENTS // max(1, s))
+    for start in range(0, n, step):
+        # Scenarios along the first axis so each scenario's scores are contiguous.
+        Y = _scores(X[start:start + step], W, thresholds)
+        V = Y > limits
+        viable += V.sum(axis=1)
+        viable_in[start:start + Y.shape[1]] = V.sum(axis=0)
+        F = V.astype(np.float32)
+        both += F @ F.T
+
+        scored = complete[start:start + step]
+        m = min(k, int(scored.sum()))
+        if m:
+            if not scored.all():
+                # Blank rows rank below every scored row, and there are at least m of those.
+                Y = np.where(scored, Y, -np.inf)
+            rows, scores = _chunk_top(Y, m)
+            # Carry each scenario's best k forward, merged with this chunk's best k.
+            best_rows = np.concatenate([best_rows, rows + start], axis=1)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            order = np.lexsort((best_rows, -best_scores), axis=-1)[:, :k]
+            best_rows = np.take_along_axis(best_rows, order, axis=1)
+            best_scores = np.take_along_axis(best_scores, order, axis=1)
+
+    names = list(names) if names is not None else [f'Scenario {i + 1}' for i in range(s)]
+    return ScenarioResults(names, thresholds, viable, viable_in, np.rint(both).astype(np.int64),
+                           best_rows, best_scores)
+
+
+def top_ranks(results, rows):
+    """``len(rows) x S`` rank (1 = best) of ``rows`` in each scenario's top list, 0 if outside it."""
+    rows = np.asarray(rows, dtype=np.int64)
+    # Compare every tracked row with every top-list entry of every scenario at once.
+    scenario, position, tracked = np.nonzero(results.top_rows[:, :, None] == rows[None, None, :])
+    ranks = np.zeros((len(rows), len(results.names)), dtype=np.int64)
+    ranks[tracked, scenario] = position + 1
+    return ranks
@@ -0,0 +1,89 @@
+"""Vectorized weighted-rank scoring.
+
+A dataset is scored as a criteria matrix ``X`` (plants x K criteria)
+times a weight vector ``w``. The viability threshold is a fixed fraction
+of the best achievable score, ``sum(w * column_max)``, exactly as the
+pages have always computed it.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+VIABILITY_FRACTION = 0.75
+DEFAULT_CRITERIA = ['GEN', 'PIPE', 'MARKET', 'INCENTIVES', 'WATER']
+VIABLE, NOT_VIABLE = 'Viable', 'Not Viable'
+
+
+class Scores(NamedTuple):
+    y: np.ndarray
+    max_y: float
+    threshold: float
+    viable: np.ndarray
+
+
+def criteria_matrix(df, columns, dtype=np.float64):
+    """Stack the selected criteria columns into a C-contiguous matrix."""
+    return np.ascontiguousarray(df[list(columns)].to_numpy(dtype=dtype))
+
+
+def column_range(X):
+    """``(minimum, maximum)`` of each criterion column of ``X``, skipping blank (NaN) cells."""
+    X = np.asarray(X)
+    return np.nanmin(X, axis=0), np.nanmax(X, axis=0)
+
+
+def as_weights(weights, dtype=np.float64):
+    return np.asarray(weights, dtype=dtype).reshape(-1)
+
+
+def weighted_sums(X, W):
+    """Scores of ``X`` under every column of the ``K x S`` weights ``W``.
+
+    Summed one criterion at a time rather than by BLAS, whose summation
+    order depends on the shapes involved, so column ``j`` is bit-identical
+    to ``score(X, W[:, j])``. With whole-number criteria many plants sit
+    exactly on the threshold, and a last-bit difference would flip them.
+    """
+    X = np.asarray(X)
+    W = np.asarray(W, dtype=X.dtype)
+    total = np.zeros(X.shape[:-1] + W.shape[1:], dtype=X.dtype)
+    for i in range(W.shape[0]):
+        total += X[..., i, None] * W[i]
+    return total
+
+
+def score(X, weights, dtype=None):
+    """Weighted sum of criteria for one plant (1-D) or many plants (2-D)."""
+    X = np.asarray(X, dtype=dtype)
+    return weighted_sums(X, as_weights(weights, X.dtype)[:, None])[..., 0]
+
+
+def max_score(column_max, weights):
+    return float(score(column_max, weights, dtype=np.float64))
+
+
+def threshold(column_max, weights, fraction=VIABILITY_FRACTION):
+    return max_score(column_max, weights) * fraction
+
+
+def evaluate(X, weights, column_max=None, fraction=VIABILITY_FRACTION, dtype=np.float64):
+    """Score every row of ``X`` and classify it against the threshold.
+
+    ``column_max`` defaults to the maxima of ``X`` itself; pass the maxima
+    of the full dataset when ``X`` is only a filtered subset. Blank (NaN)
+    cells are left out of the maxima; rows with a blank cell score NaN
+    and are never viable.
+    """
+    X = np.asarray(X, dtype=dtype)
+    if column_max is None:
+        column_max = np.nanmax(X, axis=0) if X.ndim == 2 and len(X) else np.zeros(X.shape[-1])
+    y = score(X, weights)
+    max_y = max_score(column_max, weights)
+    limit = max_y * fraction
+    return Scores(y, max_y, limit, y > limit)
+
+
+def labels(viable):
+    """Map a boolean viability array to the table labels."""
+    return np.where(viable, VIABLE, NOT_VIABLE)
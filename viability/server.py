@@ -0,0 +1,236 @@
+"""Local HTTP scoring service.
+
+Loads one dataset at start-up, keeps it (and its filter and top-k indexes)
+in memory, and answers JSON requests::
+
+    python -m viability.server plants.xlsx --port 8765
+
+Endpoints (all take and return JSON):
+
+``POST /score``
+    ``{"plants": [...PNAME...], "weights": [...], "criteria": [...]}``
+``POST /topk``
+    ``{"state": "TX", "county": "All", "k": 10, "weights": [...]}``
+``POST /montecarlo``
+    ``{"state": "TX", "weights": [...], "draws": 1000000, "seed": 0}``
+``GET /health``
+    add ``?detail=1`` for the state list and a sample of plant names
+
+``criteria`` defaults to GEN, PIPE, MARKET, INCENTIVES, WATER and
+``weights`` to equal weights. The viability threshold is 75% of the
+maximum score over the whole dataset, as on the pages. Handlers run the
+numeric work on a thread pool so concurrent requests do not queue behind
+each other on the event loop.
+"""
+
+import argparse
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import tornado.ioloop
+import tornado.web
+
+from viability import montecarlo
+from viability.hierarchy import ALL, LEVELS, hierarchy_index, sheet_positions
+from viability.ingest import read_file
+from viability.scoring import DEFAULT_CRITERIA, criteria_matrix, labels, threshold
+from viability.topk import cached_query
+
+DEFAULT_PORT = 8765
+MAX_DRAWS = 100_000_000
+SAMPLE_PLANTS = 1000
+
+
+def _json_safe(value):
+    """``value`` with NaN and infinite floats (blank scores, undefined statistics) as None."""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    return value
+
+
+class Dataset:
+    """A loaded dataset plus the indexes the endpoints share."""
+
+    def __init__(self, df, name):
+        self.df = df
+        self.name = name
+        self.index = hierarchy_index(df)
+        self._plant_rows = {}
+        for row, plant in enumerate(self.index.frame[LEVELS[2]].to_numpy()):
+            self._plant_rows.setdefault(plant, []).append(row)
+        self._column_max = {}
+
+    def plant_names(self):
+        return list(self._plant_rows)
+
+    def column_max(self, criteria):
+        key = tuple(criteria)
+        if key not in self._column_max:
+            self._column_max[key] = np.nanmax(criteria_matrix(self.df, criteria), axis=0)
+        return self._column_max[key]
+
+    def records(self, frame, y, limit):
+        state, county, plant = LEVELS
+        return [{'PSTATABB': s, 'Plant county name': c, 'PNAME': p, 'Y': float(v), 'Viability': label}
+                for s, c, p, v, label in zip(frame[state].tolist(), frame[county].tolist(),
+                                             frame[plant].tolist(), y, labels(y > limit))]
+
+    def score(self, plants, criteria, weights):
+        rows = [row for plant in plants for row in self._plant_rows.get(plant, [])]
+        frame = self.index.frame.iloc[rows]
+        y = criteria_matrix(frame, criteria) @ weights
+        limit = threshold(self.column_max(criteria), weights)
+        return {'threshold': limit, 'plants': self.records(frame, y, limit),
+                'missing': [p for p in plants if p not in self._plant_rows]}
+
+    def top_k(self, state, county, k, criteria, weights):
+        view = self.index.select(state, county)
+        key = (self.name, state, county, ALL, tuple(criteria))
+        top = cached_query(key, lambda: criteria_matrix(view, criteria), weights, k, sheet_positions(view))
+        limit = threshold(self.column_max(criteria), weights)
+        return {'threshold': limit, 'touched': top.touched, 'method': top.method,
+                'plants': self.records(view.iloc[top.rows], top.scores, limit)}
+
+    def monte_carlo(self, state, county, plant, draws, seed, criteria, weights):
+        X = criteria_matrix(self.index.select(state, county, plant), criteria)
+        if len(X) == 0:
+            raise tornado.web.HTTPError(404, reason='No plants match the selection')
+        try:
+            sim = montecarlo.simulate(X, weights, draws, threshold(np.nanmax(X, axis=0), weights), seed=seed)
+        except ValueError as exc:
+            raise tornado.web.HTTPError(400, reason=str(exc))
+        result = sim._asdict()
+        result['percentiles'] = {str(q): v for q, v in sim.percentiles.items()}
+        return result
+
+
+class Handler(tornado.web.RequestHandler):
+
+    def initialize(self, dataset, executor):
+        self.dataset = dataset
+        self.executor = executor
+
+    def body(self):
+        try:
+            body = json.loads(self.request.body or b'{}')
+        except json.JSONDecodeError as exc:
+            raise tornado.web.HTTPError(400, reason=f'Invalid JSON: {exc}')
+        if not isinstance(body, dict):
+            raise tornado.web.HTTPError(400, reason='Request body must be a JSON object')
+        return body
+
+    @staticmethod
+    def integer(body, name, default, minimum, maximum=None):
+        value = body.get(name, default)
+        # bool is an int subclass, but true/false is not a count.
+        if isinstance(value, bool) or not (isinstance(value, int) or isinstance(value, float) and value.is_integer()):
+            raise tornado.web.HTTPError(400, reason=f'{name} must be an integer')
+        if value < minimum or (maximum is not None and value > maximum):
+            bounds = f'between {minimum} and {maximum}' if maximum is not None else f'at least {minimum}'
+            raise tornado.web.HTTPError(400, reason=f'{name} must be {bounds}')
+        return int(value)
+
+    def criteria_and_weights(self, body):
+        criteria = body.get('criteria', DEFAULT_CRITERIA)
+        if not isinstance(criteria, list) or not criteria or not all(isinstance(c, str) for c in criteria):
+            raise tornado.web.HTTPError(400, reason='criteria must be a non-empty list of columns')
+        missing = [c for c in criteria if c not in self.dataset.df.columns]
+        if missing:
+            raise tornado.web.HTTPError(400, reason=f'Unknown criteria columns: {", ".join(missing)}')
+        text = [c for c in criteria if not pd.api.types.is_numeric_dtype(self.dataset.df[c])]
+        if text:
+            raise tornado.web.HTTPError(400, reason=f'Criteria columns must be numeric: {", ".join(text)}')
+        weights = body.get('weights')
+        try:
+            weights = np.full(len(criteria), 1 / len(criteria)) if weights is None else np.asarray(weights, dtype=float)
+        except (TypeError, ValueError):
+            raise tornado.web.HTTPError(400, reason='Weights must be numbers')
+        if weights.shape != (len(criteria),):
+            raise tornado.web.HTTPError(400, reason=f'Expected {len(criteria)} weights')
+        return list(criteria), weights
+
+    async def compute(self, fn, *args):
+        loop = tornado.ioloop.IOLoop.current()
+        self.write(await loop.run_in_executor(self.executor, fn, *args))
+
+    def write(self, chunk):
+        # JSON has no NaN; the default encoder would emit it bare.
+        super().write(_json_safe(chunk) if isinstance(chunk, dict) else chunk)
+
+    def write_error(self, status_code, **kwargs):
+        self.finish({'error': self._reason})
+
+
+class HealthHandler(Handler):
+
+    def get(self):
+        status = {'status': 'ok', 'dataset': self.dataset.name, 'rows': len(self.dataset.df)}
+        if self.get_argument('detail', None):
+            # Lets clients such as the load test build realistic requests.
+            status['states'] = self.dataset.index.states()
+            status['sample_plants'] = list(self.dataset.plant_names()[:SAMPLE_PLANTS])
+        self.write(status)
+
+
+class ScoreHandler(Handler):
+
+    async def post(self):
+        body = self.body()
+        criteria, weights = self.criteria_and_weights(body)
+        await self.compute(self.dataset.score, list(body.get('plants', [])), criteria, weights)
+
+
+class TopKHandler(Handler):
+
+    async def post(self):
+        body = self.body()
+        criteria, weights = self.criteria_and_weights(body)
+        await self.compute(self.dataset.top_k, body.get('state', ALL), body.get('county', ALL),
+                           self.integer(body, 'k', 10, 1), criteria, weights)
+
+
+class MonteCarloHandler(Handler):
+
+    async def post(self):
+        body = self.body()
+        criteria, weights = self.criteria_and_weights(body)
+        draws = self.integer(body, 'draws', 1_000_000, 1, MAX_DRAWS)
+        seed = self.integer(body, 'seed', montecarlo.DEFAULT_SEED, 0)
+        await self.compute(self.dataset.monte_carlo, body.get('state', ALL), body.get('county', ALL),
+                           body.get('plant', ALL), draws, seed, criteria, weights)
+
+
+def make_app(dataset, workers=None):
+    executor = ThreadPoolExecutor(workers)
+    context = {'dataset': dataset, 'executor': executor}
+    return tornado.web.Application([
+        (r'/health', HealthHandler, context),
+        (r'/score', ScoreHandler, context),
+        (r'/topk', TopKHandler, context),
+        (r'/montecarlo', MonteCarloHandler, context),
+    ])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m viability.server', description='Local HTTP scoring service.')
+    parser.add_argument('dataset', help='CSV, XLSX or Parquet file to serve')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--address', default='127.0.0.1')
+    parser.add_argument('--workers', type=int, help='threads for the numeric work')
+    args = parser.parse_args(argv)
+
+    dataset = Dataset(read_file(args.dataset), args.dataset)
+    make_app(dataset, args.workers).listen(args.port, args.address)
+    print(f'Serving {len(dataset.df):,} rows from {args.dataset} on http://{args.address}:{args.port}')
+    tornado.ioloop.IOLoop.current().start()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""Top-k plants under a weight vector without scoring every row.
+
+``TopKIndex`` keeps every criterion column presorted (descending) and
+answers queries with Fagin's threshold algorithm: rows are read in sorted
+order from each column in growing blocks, scored by random access, and the
+search stops as soon as the k-th best score beats the best score any unseen
+row could still reach. That only happens early when the top of the columns
+is spread out; heavily tied criteria (small integer scales) or many
+uncorrelated columns keep the bound high past most of the data.
+``search_pays`` estimates the stopping depth from a sample of rows before
+searching, and queries that would not stop early (or that still touch too
+many rows) fall back to one vectorized ``argpartition`` scan.
+
+Ties go to the row that comes first in the uploaded sheet (``positions``,
+by default the row order of ``X``), so results match ``DataFrame.nlargest``
+on the sheet even for views regrouped by state and county.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+from viability.cache import ByteLRU
+from viability.scoring import score
+
+# Random-access scoring costs several times a sequential scan per row, so give
+# up on the threshold algorithm once it has scored this share of rows.
+MAX_TOUCH_FRACTION = 0.05
+FIRST_BLOCK = 64
+# Rows sampled to estimate how deep the threshold search has to read.
+SAMPLE_ROWS = 4096
+INDEX_BUDGET = 512 * 2**20
+
+# Presorted indexes (and the matrices behind them), keyed by dataset, filter
+# and columns (or by stage key).
+indexes = ByteLRU(INDEX_BUDGET)
+
+
+class TopK(NamedTuple):
+    rows: np.ndarray
+    scores: np.ndarray
+    touched: int
+    method: str
+
+
+def _ordered(rows, scores, positions=None):
+    order = np.lexsort((rows if positions is None else positions[rows], -scores))
+    return rows[order], scores[order]
+
+
+def top_k(X, weights, k, positions=None):
+    """Exact top ``k`` rows of ``score(X, weights)`` with a full vectorized scan.
+
+    Rows scoring NaN (a blank criterion cell) are skipped, as ``nlargest`` does.
+    Tied rows are taken in order of ``positions`` (each row's sheet position).
+    """
+    y = score(X, weights, dtype=np.float64)
+    n = y.size
+    scored = np.flatnonzero(~np.isnan(y))
+    values = y[scored]
+    k = min(int(k), scored.size)
+    if k <= 0:
+        return TopK(np.empty(0, dtype=np.int64), np.empty(0), n, 'scan')
+    kth = np.partition(values, values.size - k)[values.size - k]
+    above = scored[values > kth]
+    ties = scored[values == kth]
+    if positions is not None:
+        ties = ties[np.argsort(positions[ties])]
+    rows = np.concatenate([above, ties[:k - above.size]])
+    rows, scores = _ordered(rows, y[rows], positions)
+    return TopK(rows, scores, n, 'scan')
+
+
+def search_pays(X, weights, k, max_touch_fraction=MAX_TOUCH_FRACTION):
+    """Whether the threshold search over ``X`` should stop within its budget.
+
+    An evenly spaced sample of rows stands in for the data: its k-th best
+    score (as a share of the sample) estimates the score to beat, and its
+    sorted columns the bound at each depth. The search is only worth
+    running (and its index only worth building) when the estimated depth
+    touches at most ``max_touch_fraction`` of the rows.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    n, columns = np.shape(X)
+    k = min(int(k), n)
+    active = np.flatnonzero(weights > 0)
+    # The threshold bound needs monotone (non-negative) weights, and with
+    # k close to n / K sorted access alone would read most of the data.
+    if k <= 0 or (weights < 0).any() or active.size == 0 or k * columns * 4 > n:
+        return False
+    sample = np.asarray(X[::max(1, n // SAMPLE_ROWS)], dtype=np.float64)
+    y = sample @ weights
+    y = np.sort(y[~np.isnan(y)])[::-1]
+    if y.size == 0:
+        return False
+    kth = y[min(y.size - 1, k * y.size // n)]
+    # Descending columns with blank cells last, as in the index.
+    bound = -np.sort(-sample[:, active], axis=0) @ weights[active]
+    stops = np.flatnonzero(~(bound >= kth))
+    depth = (stops[0] + 1 if stops.size else len(sample)) / len(sample)
+    return depth * active.size <= max_touch_fraction
+
+
+class TopKIndex:
+    """Per-criterion presorted index over a plants x K criteria matrix."""
+
+    def __init__(self, X):
+        self.X = np.ascontiguousarray(X, dtype=np.float64)
+        n = len(self.X)
+        index_type = np.int32 if n < 2**31 else np.int64
+        self.sorted_rows = np.argsort(-self.X, axis=0, kind='stable').astype(index_type)
+        self.sorted_values = np.take_along_axis(self.X, self.sorted_rows, axis=0)
+
+    @property
+    def nbytes(self):
+        return self.X.nbytes + self.sorted_rows.nbytes + self.sorted_values.nbytes
+
+    def query(self, weights, k, max_touch_fraction=MAX_TOUCH_FRACTION, positions=None):
+        weights = np.asarray(weights, dtype=np.float64)
+        n = len(self.X)
+        k = min(int(k), n)
+        if not search_pays(self.X, weights, k, max_touch_fraction):
+            return top_k(self.X, weights, k, positions)
+        active = np.flatnonzero(weights > 0)
+
+        budget = max_touch_fraction * n
+        seen = np.zeros(n, dtype=bool)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0)
+        touched = 0
+        depth, block = 0, max(FIRST_BLOCK, k)
+        while depth < n:
+            stop = min(n, depth + block)
+            candidates = np.unique(self.sorted_rows[depth:stop, active])
+            candidates = candidates[~seen[candidates]].astype(np.int64)
+            seen[candidates] = True
+            touched += candidates.size
+
+            candidate_scores = score(self.X[candidates], weights)
+            # Rows with a blank criterion score NaN and never rank.
+            scored = ~np.isnan(candidate_scores)
+            rows = np.concatenate([best_rows, candidates[scored]])
+            scores = np.concatenate([best_scores, candidate_scores[scored]])
+            if rows.size > k:
+                rows, scores = _ordered(rows, scores, positions)
+                rows, scores = rows[:k], scores[:k]
+            best_rows, best_scores = rows, scores
+
+            # No unseen row can score above the weighted values at this depth
+            # (summed in the same order as the scores, so rounding cannot cross).
+            bound = score(self.sorted_values[stop - 1, active], weights[active])
+            if np.isnan(bound):
+                # Blank cells sort last, so every unseen row has one and scores NaN.
+                break
+            if best_rows.size == k and best_scores.min() > bound:
+                break
+            if touched > budget:
+                return top_k(self.X, weights, k, positions)._replace(method='scan (threshold search gave up)')
+            depth, block = stop, block * 2
+
+        rows, scores = _ordered(best_rows, best_scores, positions)
+        return TopK(rows, scores, touched, 'threshold')
+
+
+def cached_query(key, build_matrix, weights, k, positions=None):
+    """Top ``k`` rows of the criteria matrix memoized under ``key`` (dataset, filter and columns).
+
+    ``build_matrix`` is only called on a miss, so a hit does not even gather
+    the criteria columns. The presorted index is built (and kept) only for
+    queries the threshold search should answer early; the rest are scanned.
+    """
+    X = indexes.get((key, 'matrix'))
+    if X is None:
+        X = np.ascontiguousarray(build_matrix(), dtype=np.float64)
+        indexes.put((key, 'matrix'), X, X.nbytes)
+    if not search_pays(X, weights, k):
+        return top_k(X, weights, k, positions)
+    index = indexes.get((key, 'index'))
+    if index is None:
+        index = TopKIndex(X)
+        indexes.put((key, 'index'), index, index.nbytes)
+    return index.query(weights, k, positions=positions)
@@ -0,0 +1,457 @@
+"""Streamlit helpers shared by the pages."""
+
+import time
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from viability import cache, dag, ingest, instrument, jobs, registry, topk
+from viability.cache import ByteLRU
+from viability.hierarchy import sheet_order, sheet_positions
+from viability.ingest import IDENTIFIER_COLUMNS
+from viability.montecarlo import ConvergenceResult
+from viability.scoring import DEFAULT_CRITERIA, labels
+from viability.topk import TopKIndex, top_k
+
+PREVIEW_PAGE_ROWS = 50
+PREVIEW_FALLBACK_COLUMNS = 10
+FILE_ORDER = '(file order)'
+
+_preview_orders = ByteLRU(64 * 2**20)
+
+
+def dataset_key():
+    """Content hash of the dataset this session is working on."""
+    return st.session_state.get('dataset_key')
+
+
+def page_graph(page):
+    """Stage graph for this run of ``page``, compared with its previous run in this session."""
+    return dag.Graph(page, st.session_state.get(f'stage_graph:{page}'))
+
+
+def dataset_stage(graph, df):
+    """Ingest stage: the session's dataset, identified by its content hash."""
+    return graph.source('ingest', dataset_key(), df)
+
+
+def show_graph(graph):
+    """Keep this run's stages for the next one; optionally list which of them recomputed."""
+    st.session_state[f'stage_graph:{graph.page}'] = graph.snapshot()
+    if not graph.nodes or not st.sidebar.checkbox('Show recomputed stages'):
+        return
+    report = graph.report()
+    with st.sidebar.expander('Stage graph', expanded=True):
+        st.dataframe({
+            'Stage': [r['stage'] for r in report],
+            'Inputs': [', '.join(r['inputs']) for r in report],
+            'Status': [r['status'] for r in report],
+            'Changed': [', '.join(r['changed']) for r in report],
+            'ms': [round(r['seconds'] * 1000, 2) for r in report],
+        })
+        recomputed = sum(r['status'] == dag.RECOMPUTED for r in report)
+        st.caption(f'{recomputed} of {len(report)} stages recomputed on the last interaction.')
+
+
+def show_cache_stats():
+    stats = cache.results.stats()
+    st.sidebar.caption(f"Result cache: {stats['hits']:,} hits, {stats['misses']:,} misses, "
+                       f"{stats['entries']:,} entries ({stats['bytes'] / 2**20:,.1f} MB)")
+
+
+def uploaded_dataset(label="Upload an Excel, CSV or Parquet file"):
+    """File uploader backed by the shared ingest cache and dataset registry.
+
+    A workbook uploaded on any page is remembered for the session, so the
+    other pages can use it without uploading (or parsing) it again, and
+    datasets other sessions have loaded can be picked without uploading.
+    """
+    uploaded_file = st.file_uploader(label, type=list(ingest.UPLOAD_TYPES))
+    if uploaded_file is not None:
+        key, df = load_upload(uploaded_file)
+        if df is None:
+            return None
+    else:
+        key = registered_dataset(st.session_state.get('dataset_key'))
+        if key is None:
+            return None
+        df = ingest.load_key(key)
+        if df is None:
+            return None
+        st.caption('Using a dataset loaded earlier on this server.')
+
+    st.session_state['dataset_key'] = key
+    hold_dataset(key)
+    memory_report(key, df)
+    return df
+
+
+def upload_digest(uploaded_file):
+    """Content hash of an upload, computed once per uploaded file rather than on every rerun."""
+    file_id = getattr(uploaded_file, 'file_id', None) or getattr(uploaded_file, 'id', None)
+    cached = st.session_state.get('upload_digest')
+    if cached is None or cached[0] != file_id or file_id is None:
+        cached = st.session_state['upload_digest'] = (file_id, ingest.file_digest(uploaded_file.getvalue()))
+    return cached[1]
+
+
+def load_upload(uploaded_file):
+    """Sheet and column pickers for an upload, then a background parse with progress.
+
+    Returns ``(key, DataFrame)``, or ``(None, None)`` if the file could not
+    be read. Only the chosen columns are parsed; the page stays responsive
+    while a large file loads, and a rerun picks the same load back up.
+    """
+    data = uploaded_file.getvalue()
+    digest = upload_digest(uploaded_file)
+    kind = ingest.file_kind(uploaded_file.name)
+    sheet = None
+    if kind == 'xlsx':
+        sheets = ingest.sheet_names(data, digest)
+        if len(sheets) > 1:
+            sheet = st.selectbox('Worksheet', sheets)
+            sheet = None if sheet == sheets[0] else sheet
+
+    header = ingest.read_header(data, kind, sheet, digest)
+    wanted = [c for c in header if c in IDENTIFIER_COLUMNS or c in DEFAULT_CRITERIA]
+    if not any(c in DEFAULT_CRITERIA for c in wanted):
+        wanted = header
+    chosen = st.multiselect('Columns to load', header, default=wanted)
+    columns = None if not chosen or set(chosen) == set(header) else chosen
+
+    job = ingest.load_async(data, uploaded_file.name, sheet, columns, kind, digest)
+    if not job.done:
+        bar = st.progress(0.0)
+        while not job.done:
+            bar.progress(job.progress, text=f'{job.stage} {uploaded_file.name}: {job.rows:,} rows')
+            time.sleep(0.2)
+        bar.empty()
+    if job.error is not None:
+        st.error(f'Could not read {uploaded_file.name}: {job.error}')
+        return None, None
+    df = ingest.load_key(job.key)
+    if df is None:
+        return None, None
+    st.caption(f'Loaded {len(df):,} rows x {len(df.columns)} columns in {job.seconds:.1f} s.')
+    return job.key, df
+
+
+def registered_dataset(current):
+    """Let the user pick a dataset from the registry; defaults to ``current``."""
+    entries = {d['key']: d for d in registry.datasets()}
+    if not entries:
+        return current
+    options = [None] + list(entries)
+    if current is not None and current not in entries:
+        options.append(current)
+
+    def describe(key):
+        if key is None:
+            return '(none)'
+        entry = entries.get(key)
+        if entry is None:
+            return 'Workbook uploaded earlier in this session'
+        return (f"{entry['name']} ({entry['rows']:,} rows, {entry['bytes'] / 2**20:,.1f} MB, "
+                f"{entry['sessions']} in use)")
+
+    return st.selectbox('Or use a dataset already loaded on this server', options,
+                        index=options.index(current) if current in options else 0, format_func=describe)
+
+
+def hold_dataset(key):
+    """Keep a registry lease on the session's dataset, dropping the previous one."""
+    lease = st.session_state.get('dataset_lease')
+    if lease is not None and lease.key == key:
+        return
+    if lease is not None:
+        lease.release()
+    st.session_state['dataset_lease'] = registry.Lease(key) if registry.is_registered(key) else None
+
+
+def memory_report(key, df):
+    """Collapsed before/after memory summary of the compacted dataset."""
+    report = ingest.memory_report(key)
+    with st.expander(f'Dataset memory: {df.memory_usage(deep=True).sum() / 2**20:,.1f} MB'):
+        if report is None:
+            st.caption('Loaded from the local dataset cache; the parse-time report is not available.')
+            return
+        st.write(f"Parsed sheet: {report['before_bytes'] / 2**20:,.1f} MB, "
+                 f"held in memory: {report['after_bytes'] / 2**20:,.1f} MB "
+                 f"({1 - report['after_bytes'] / max(report['before_bytes'], 1):.0%} smaller).")
+        if report['dropped']:
+            st.write(f"Dropped unused columns: {', '.join(report['dropped'])}")
+        st.dataframe({'Column': list(report['dtypes']),
+                      'Parsed as': [before for before, _ in report['dtypes'].values()],
+                      'Held as': [after for _, after in report['dtypes'].values()]})
+
+
+def criteria_columns(df, defaults=DEFAULT_CRITERIA):
+    """Selectboxes assigning dataset columns to criteria X1..XK."""
+    available_columns = df.columns.tolist()
+    count = st.number_input('Number of criteria', min_value=1, max_value=len(available_columns),
+                            value=min(len(defaults), len(available_columns)), step=1)
+    columns = []
+    for i in range(int(count)):
+        default = defaults[i] if i < len(defaults) else None
+        index = available_columns.index(default) if default in available_columns else 0
+        columns.append(st.selectbox(f'Select column for X{i + 1}', available_columns, index=index))
+    return columns
+
+
+def weight_sliders(count):
+    """One 0-100 slider per criterion, returned as fractions."""
+    default = 100 // count
+    return [st.slider(f"Weight w{i + 1}", 0, 100, default) / 100.0 for i in range(count)]
+
+
+def top_scores(graph, df_view, matrix, weights, list_size, limit):
+    """Top ``list_size`` rows of ``df_view`` with their Y and Viability against the ``limit`` stage.
+
+    ``matrix`` is the stage holding the criteria of ``df_view``. Where the
+    threshold search is expected to stop early, a presorted top-k index over
+    it is added to ``graph`` and queried, scoring just the rows the search
+    touches; otherwise (e.g. heavily tied 1-5 scales) the rows are scanned
+    without building the index. Ties go to the plant first in the sheet.
+    """
+    params = (weights, int(list_size))
+    positions = sheet_positions(df_view)
+    if topk.search_pays(matrix.value, weights, list_size):
+        index = graph.node('top-k index', TopKIndex, matrix, store=topk.indexes)
+        top = graph.node('top-k', lambda index: index.query(weights, list_size, positions=positions),
+                         index, params=params).value
+    else:
+        top = graph.node('top-k', lambda X: top_k(X, weights, list_size, positions), matrix, params=params).value
+    st.caption(f'Top {top.rows.size} found after scoring {top.touched:,} of {len(df_view):,} rows ({top.method}).')
+    return df_view.iloc[top.rows].assign(Y=top.scores, Viability=labels(top.scores > limit.value))
+
+
+def closest_to_viability(df_view, change, criteria, list_size):
+    """Non-viable rows nearest the threshold with the score and weight change each needs.
+
+    ``change`` is the ``minimum_change`` result for the rows of ``df_view``.
+    """
+    not_viable = np.flatnonzero(change.gap >= 0)
+    rows = not_viable[np.argsort(change.gap[not_viable], kind='stable')[:list_size]]
+    st.caption(f'{not_viable.size:,} of {len(df_view):,} plants are not viable. Scores are raised on the '
+               f'highest-weighted criteria first; weights are the closest ones with the same total.')
+
+    def describe(values, fmt):
+        if not np.isfinite(values).all():
+            return 'Not reachable'
+        return ', '.join(fmt(c, v) for c, v in zip(criteria, values) if fmt(c, v))
+
+    return df_view.iloc[rows][IDENTIFIER_COLUMNS].assign(**{
+        'Gap to threshold': change.gap[rows],
+        'Score change': [describe(r, lambda c, d: f'{c} +{d:.2f}' if d > 0 else '')
+                         for r in change.score_change[rows]],
+        'Weights needed': [describe(r, lambda c, v: f'{c} {100 * v:.0f}%') for r in change.weights[rows]],
+    })
+
+
+def job_key(name, *parts):
+    """Key of a background job, built like the result cache keys."""
+    return cache.result_key(name, dataset_key(), *parts)
+
+
+def submit_job(key, fn, *args, label=None, **kwargs):
+    """Start ``fn`` as a background job and remember it for this session."""
+    job = jobs.submit(key, fn, *args, label=label, **kwargs)
+    submitted = st.session_state.setdefault('jobs', [])
+    if key not in submitted:
+        submitted.append(key)
+    return job
+
+
+def show_job(key, render, noun='simulation'):
+    """Progress and a cancel button for the job under ``key``, or its result once done.
+
+    ``render(result)`` draws a finished job's result. Returns a handle for
+    ``follow_job`` while the job is still running, ``None`` otherwise.
+    """
+    job = jobs.get(key)
+    if job is None:
+        return None
+    slot = st.empty()
+    with slot.container():
+        if job.state == jobs.DONE:
+            render(job.result)
+        elif job.state == jobs.FAILED:
+            st.error(f'The {noun} failed: {job.error}')
+        elif job.state == jobs.CANCELLED:
+            st.info(f'The {noun} was cancelled.')
+        else:
+            bar = st.progress(job.progress, text=_job_text(job, noun))
+            if st.button(f'Cancel {noun}', key=f'cancel-{hash(key)}'):
+                job.cancel()
+            return job, slot, bar, render, noun
+    return None
+
+
+def _job_text(job, noun):
+    if job.state == jobs.QUEUED:
+        return f'The {noun} is waiting for a free worker.'
+    return f'Running the {noun}: {job.completed:,} of ~{job.total or 0:,} draws.'
+
+
+def follow_job(handle, interval=0.25):
+    """Keep a ``show_job`` progress bar moving, then draw the result in its place.
+
+    Call it last on the page: it waits for the job, but any widget change
+    interrupts the wait (the job itself keeps running).
+    """
+    if handle is None:
+        return
+    job, slot, bar, render, noun = handle
+    while not job.finished:
+        bar.progress(job.progress, text=_job_text(job, noun))
+        time.sleep(interval)
+    with slot.container():
+        if job.state == jobs.DONE:
+            render(job.result)
+        elif job.state == jobs.FAILED:
+            st.error(f'The {noun} failed: {job.error}')
+        else:
+            st.info(f'The {noun} was cancelled.')
+
+
+def show_session_jobs():
+    """Sidebar list of the background jobs this session started."""
+    submitted = [j for j in map(jobs.get, st.session_state.get('jobs', [])) if j is not None]
+    if not submitted:
+        return
+    with st.sidebar.expander(f'Background jobs ({sum(not j.finished for j in submitted)} running)'):
+        st.dataframe({'Job': [j.label for j in submitted],
+                      'State': [j.state for j in submitted],
+                      'Progress (%)': [round(100 * j.progress) for j in submitted],
+                      'Seconds': [None if j.seconds is None else round(j.seconds, 1) for j in submitted]})
+
+
+def simulation_results(result):
+    """Summary of a ``simulate`` or ``simulate_until`` result."""
+    run = result if isinstance(result, ConvergenceResult) else None
+    sim = run.simulation if run is not None else result
+    st.subheader('Simulation Results')
+    st.write(f'Average Y value from {sim.draws} simulations: {sim.mean} '
+             f'(standard error {sim.std_error:.3g}, seed {sim.seed})')
+    st.write(f'Probability that Y exceeds the viability threshold ({sim.threshold:.3f}): {sim.p_viable:.2%}')
+    if run is not None:
+        if run.converged:
+            st.write(f'Converged after {sim.draws:,} draws in {run.seconds:.2f} s: '
+                     f'mean Y ± {run.mean_half_width:.2g}, P(viable) ± {run.p_half_width:.2g}.')
+        else:
+            st.warning(f'Stopped at {sim.draws:,} draws ({run.seconds:.2f} s) before reaching the '
+                       f'tolerance: mean Y ± {run.mean_half_width:.2g}, P(viable) ± {run.p_half_width:.2g}.')
+        st.line_chart({'Mean Y half-width': [h for _, h, _ in run.history],
+                       'P(viable) half-width': [h for _, _, h in run.history]})
+    st.table({'Percentile': [f'P{q}' for q in sim.percentiles],
+              'Y': list(sim.percentiles.values())})
+
+    # Determine if the project is viable
+    if sim.mean > sim.threshold:
+        st.success("Viable Project")
+    else:
+        st.warning("Not a viable project")
+
+
+def group_rankings(intervals, noun):
+    """Groups ranked by mean Y with their bootstrap intervals, as a table and an error-bar chart."""
+    import altair as alt
+
+    order = np.argsort(-intervals.mean, kind='stable')
+    table = pd.DataFrame({
+        'Rank': np.arange(1, len(order) + 1),
+        noun: [intervals.groups[i] for i in order],
+        'Plants': intervals.size[order],
+        'Mean Y': intervals.mean[order],
+        'Mean Y low': intervals.mean_low[order],
+        'Mean Y high': intervals.mean_high[order],
+        'Viable (%)': 100 * intervals.viable[order],
+        'Viable low (%)': 100 * intervals.viable_low[order],
+        'Viable high (%)': 100 * intervals.viable_high[order],
+    })
+    st.caption(f'{intervals.replicates:,} bootstrap replicates; intervals are percentile intervals.')
+    st.dataframe(table)
+
+    shown = table.head(50)
+    y = alt.Y(f'{noun}:N', sort=shown[noun].tolist(), title=None)
+    bars = alt.Chart(shown).mark_rule().encode(x=alt.X('Mean Y low:Q', title='Mean Y', scale=alt.Scale(zero=False)),
+                                              x2='Mean Y high:Q', y=y)
+    points = alt.Chart(shown).mark_point(filled=True).encode(x='Mean Y:Q', y=y,
+                                                             tooltip=[noun, 'Plants', 'Mean Y', 'Viable (%)'])
+    st.altair_chart(bars + points)
+
+
+def page_profile(page):
+    """Per-rerun stage profile, enabled by the sidebar toggle or ``VIABILITY_PROFILE``."""
+    enabled = instrument.env_enabled() or st.sidebar.checkbox('Profile this page')
+    return instrument.Profile(page, enabled)
+
+
+def show_profile(profile):
+    """Sidebar timing breakdown for the run that just finished, optionally logged."""
+    if not profile.enabled:
+        return
+    total = profile.finish()
+    with st.sidebar.expander('Timing breakdown', expanded=True):
+        st.dataframe({
+            'Stage': [r['stage'] for r in profile.records],
+            'ms': [round(r['seconds'] * 1000, 2) for r in profile.records],
+            'Rows': [r['rows'] for r in profile.records],
+            'Allocated (KB)': [round(r.get('allocated_bytes', 0) / 1024, 1) for r in profile.records],
+            'Peak (KB)': [round(r.get('peak_bytes', 0) / 1024, 1) for r in profile.records],
+        })
+        st.caption(f'Total {total * 1000:.1f} ms for this rerun.')
+        if st.checkbox('Append timings to log', value=instrument.env_logging()):
+            profile.write_log()
+            st.caption(f'Appended to {instrument.log_path()}')
+
+
+def _sorted_rows(df, column, descending):
+    key = (dataset_key(), column, descending)
+    rows = _preview_orders.get(key)
+    if rows is None:
+        # A stable sort of the values in sheet order keeps tied rows in sheet order.
+        in_sheet = sheet_order(sheet_positions(df))
+        values = df[column].take(in_sheet).reset_index(drop=True)
+        try:
+            ordered = values.sort_values(ascending=not descending, kind='mergesort', na_position='last')
+        except TypeError:
+            # Mixed types in a hand-edited column: sort by their text instead.
+            ordered = values.astype(str).sort_values(ascending=not descending, kind='mergesort')
+        rows = _preview_orders.put(key, in_sheet[ordered.index.to_numpy()])
+    return rows
+
+
+def dataset_preview(df, columns):
+    """Paginated preview of the identifiers and ``columns``, sorted and searched server-side.
+
+    Only the current page of the projected columns is sent to the browser.
+    """
+    shown = [c for c in dict.fromkeys(IDENTIFIER_COLUMNS + list(columns)) if c in df.columns]
+    if not shown:
+        shown = df.columns[:PREVIEW_FALLBACK_COLUMNS].tolist()
+
+    search_col, sort_col, order_col = st.columns([2, 2, 1])
+    search = search_col.text_input('Search identifiers', key='preview_search').strip()
+    sort_by = sort_col.selectbox('Sort preview by', [FILE_ORDER] + shown, key='preview_sort')
+    descending = order_col.checkbox('Descending', key='preview_descending')
+
+    # Compacted uploads are grouped by state and county; show them in sheet order.
+    rows = sheet_order(sheet_positions(df)) if sort_by == FILE_ORDER else _sorted_rows(df, sort_by, descending)
+    if search:
+        identifiers = [c for c in IDENTIFIER_COLUMNS if c in df.columns] or shown
+        match = np.zeros(len(df), dtype=bool)
+        for column in identifiers:
+            match |= df[column].astype(str).str.contains(search, case=False, regex=False).to_numpy()
+        rows = rows[match[rows]]
+
+    pages = max(1, -(-rows.size // PREVIEW_PAGE_ROWS))
+    page = st.number_input(f'Preview page (of {pages})', min_value=1, max_value=pages, value=1, step=1,
+                           key='preview_page')
+    start = (int(page) - 1) * PREVIEW_PAGE_ROWS
+    page_rows = rows[start:start + PREVIEW_PAGE_ROWS]
+    st.dataframe(df.iloc[page_rows][shown])
+    hidden = len(df.columns) - len(shown)
+    st.caption(f'Rows {start + 1 if page_rows.size else 0}-{start + page_rows.size} of {rows.size:,}'
+               f'{" matching" if search else ""}; {hidden} column{"s" if hidden != 1 else ""} hidden.')